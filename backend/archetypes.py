@@ -0,0 +1,286 @@
+"""
+Character Archetype Library
+
+Persistent library of validated dynamic characters, indexed by normalized role
+and setting era. When a mention like "the gardener" comes up in a case whose
+setting matches an archetype we already have, the character is instantiated
+from the library with case-specific details instead of running a fresh
+Storyteller + Logic AI generation.
+"""
+
+import random
+import re
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+# Synonyms collapsed onto one canonical role so "chef" and "cook" share archetypes
+ROLE_SYNONYMS = {
+    "chef": "cook",
+    "kitchen maid": "cook",
+    "housemaid": "maid",
+    "parlour maid": "maid",
+    "parlor maid": "maid",
+    "chambermaid": "maid",
+    "chauffeur": "driver",
+    "coachman": "driver",
+    "groundskeeper": "gardener",
+    "grounds keeper": "gardener",
+    "valet": "butler",
+    "manservant": "butler",
+    "physician": "doctor",
+    "postman": "mailman",
+    "mail carrier": "mailman",
+    "delivery man": "delivery person",
+    "delivery boy": "delivery person",
+    "courier": "delivery person",
+}
+
+ROLE_STOPWORDS = {"the", "a", "an", "our", "my", "his", "her", "their", "your", "old", "new", "family", "local"}
+
+# Era buckets, checked in order against the case setting
+ERA_KEYWORDS = [
+    ("future", ["futuristic", "space station", "starship", "colony", "cyberpunk", "year 2"]),
+    ("medieval", ["medieval", "castle keep", "middle ages", "feudal"]),
+    ("victorian", ["victorian", "gaslight", "gas-lit"]),
+    ("edwardian", ["edwardian", "titanic"]),
+    ("interwar", ["jazz age", "roaring twenties", "prohibition", "art deco"]),
+    ("contemporary", ["modern", "contemporary", "present day", "present-day", "smartphone", "tech startup"]),
+]
+
+NAME_POOLS = {
+    "victorian": (
+        ["Arthur", "Edmund", "Walter", "Albert", "Ada", "Florence", "Harriet", "Beatrice", "Silas", "Agnes"],
+        ["Hargreaves", "Pembroke", "Whitlock", "Ashby", "Thornton", "Crabtree", "Fairfax", "Mortimer"],
+    ),
+    "edwardian": (
+        ["Cecil", "Herbert", "Percy", "Edith", "Mabel", "Winifred", "Reginald", "Violet", "Stanley", "Ivy"],
+        ["Bellamy", "Carrow", "Dunmore", "Ellison", "Fenwick", "Gatling", "Holloway", "Kettering"],
+    ),
+    "interwar": (
+        ["Clarence", "Harold", "Leonard", "Dorothy", "Vera", "Mildred", "Frank", "Ruby", "Sidney", "Hazel"],
+        ["Blake", "Carmichael", "Dawson", "Finch", "Graves", "Marlowe", "Prentice", "Sinclair"],
+    ),
+    "mid_century": (
+        ["Gerald", "Raymond", "Norman", "Betty", "Joan", "Shirley", "Donald", "Peggy", "Roy", "Audrey"],
+        ["Bradley", "Coleman", "Douglas", "Fletcher", "Hayes", "Lawson", "Porter", "Walsh"],
+    ),
+    "late_20th": (
+        ["Gary", "Kevin", "Wayne", "Tracy", "Donna", "Karen", "Neil", "Sharon", "Derek", "Lisa"],
+        ["Bishop", "Collins", "Doyle", "Foster", "Hughes", "Marsh", "Reeves", "Turner"],
+    ),
+    "contemporary": (
+        ["Liam", "Noah", "Maya", "Chloe", "Ethan", "Priya", "Jordan", "Zoe", "Marcus", "Leah"],
+        ["Alvarez", "Brennan", "Choi", "Desai", "Novak", "Okafor", "Patel", "Reyes"],
+    ),
+    "medieval": (
+        ["Aldric", "Godwin", "Osric", "Edith", "Maud", "Isolde", "Bertram", "Rowena", "Wulfric", "Elinor"],
+        ["of Ashford", "Miller", "Fletcher", "Thatcher", "Cooper", "of Kent", "Mason", "Ward"],
+    ),
+    "future": (
+        ["Kai", "Nova", "Orion", "Lyra", "Juno", "Ezra", "Sol", "Vega", "Rhys", "Ione"],
+        ["Arkwright", "Castellan", "Drake", "Hale", "Kestrel", "Mercer", "Quill", "Varga"],
+    ),
+}
+NAME_POOLS["unspecified"] = NAME_POOLS["interwar"]
+
+# Keep the library from growing without bound for very common roles
+MAX_ARCHETYPES_PER_KEY = 20
+
+
+def normalize_role(role: str) -> str:
+    """Normalize a mentioned role ("our Cook", "the chauffeur's") to a canonical key"""
+    text = re.sub(r"'s\b", "", (role or "").lower())
+    text = re.sub(r"[^a-z\s-]", " ", text)
+    words = [w for w in text.split() if w not in ROLE_STOPWORDS]
+    normalized = " ".join(words)
+    return ROLE_SYNONYMS.get(normalized, normalized)
+
+
+def role_keys(role: str) -> List[str]:
+    """Library keys to try for a role, most specific first: "head gardener", then its head noun "gardener"
+    (the same fallback mentions.py uses)"""
+    key = normalize_role(role)
+    if not key:
+        return []
+    head = key.split()[-1]
+    head = ROLE_SYNONYMS.get(head, head)
+    return [key] if head == key else [key, head]
+
+
+_DECADE = re.compile(r"\b((?:1[0-9]|20|21)\d0)s\b")
+_YEAR = re.compile(r"\b(?:in|of|year|circa|c\.|during|since|around|summer|winter|spring|autumn)\s+((?:1[0-9]|20|21)\d{2})\b")
+# A standalone year ("A country house, 1890", "1890 London"); one followed by a lowercase word
+# counts something ("1500 rooms")
+_BARE_YEAR = re.compile(r"\b(1[5-9]\d{2}|20\d{2})\b(?!\s+[a-z])")
+
+# Capitalized title words that name no place ("Murder at Blackwood Manor")
+_TITLE_WORDS = {"A", "An", "The", "At", "In", "On", "Of", "Aboard", "Murder", "Death", "Mystery", "Case", "Last",
+                "Cold", "Offline", "Secret", "Affair", "Killing", "Crime", "Night", "Vintage"}
+
+
+def detect_era(setting: str) -> str:
+    """Map a free-form case setting to a coarse era bucket"""
+    text = (setting or "").lower()
+
+    # Explicit decades and years win over keywords ("1920s", "in 1887", "a country house, 1890");
+    # a number that counts something ("1500 rooms") is not a date
+    match = _DECADE.search(text) or _YEAR.search(text) or _BARE_YEAR.search(setting or "")
+    if match:
+        year = int(match.group(1))
+        if year < 1500:
+            return "medieval"
+        if year < 1901:
+            return "victorian"
+        if year < 1918:
+            return "edwardian"
+        if year < 1940:
+            return "interwar"
+        if year < 1970:
+            return "mid_century"
+        if year < 2000:
+            return "late_20th"
+        if year < 2100:
+            return "contemporary"
+        return "future"
+
+    for era, keywords in ERA_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return era
+    return "unspecified"
+
+
+def _escape_braces(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def case_proper_nouns(case: dict, name: str) -> List[str]:
+    """Names from the source case that mean nothing in another one: other characters and places"""
+    nouns = set()
+    for character in case.get("characters", []):
+        if character.get("name") and character["name"] != name:
+            nouns.update(part for part in character["name"].split() if len(part) > 2)
+    for text in (case.get("title", ""), case.get("setting", "")):
+        nouns.update(word for word in re.findall(r"\b[A-Z][a-z]+\b", text) if word not in _TITLE_WORDS)
+    return sorted(nouns)
+
+
+def _templatize(text: str, name: str, victim_name: str, proper_nouns: List[str] = ()) -> str:
+    """Replace case-specific names in a character field with format placeholders.
+
+    Sentences naming anything else from the source case (another character, the house, the town)
+    are dropped, since no placeholder fits them in a new case.
+    """
+    text = _escape_braces(text or "")
+    if proper_nouns:
+        other = re.compile(rf"\b({'|'.join(re.escape(noun) for noun in proper_nouns)})\b")
+        sentences = re.split(r"(?<=[.!?])\s+", text)
+        text = " ".join(sentence for sentence in sentences if not other.search(sentence))
+    if victim_name:
+        text = re.sub(re.escape(victim_name), "{victim}", text)
+    if name:
+        text = re.sub(re.escape(name), "{name}", text)
+        parts = name.split()
+        if len(parts) > 1:
+            text = re.sub(rf"\b{re.escape(parts[-1])}\b", "{last_name}", text)
+            text = re.sub(rf"\b{re.escape(parts[0])}\b", "{first_name}", text)
+    return text
+
+
+class ArchetypeLibrary:
+    """Mongo-backed library of reusable character archetypes"""
+
+    def __init__(self, db):
+        self.collection = db.character_archetypes
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("role", 1), ("era", 1)])
+
+    async def record(self, role: str, case: dict, char_data: dict):
+        """Store a validated dynamic character as an archetype for future cases"""
+        key_role = normalize_role(role)
+        if not key_role:
+            return
+        era = detect_era(case.get("setting", ""))
+
+        existing = await self.collection.count_documents({"role": key_role, "era": era})
+        if existing >= MAX_ARCHETYPES_PER_KEY:
+            return
+
+        name = char_data.get("name", "")
+        victim_name = case.get("victim_name", "")
+        nouns = case_proper_nouns(case, name)
+        fields = {
+            field: _templatize(char_data.get(field) or default, name, victim_name, nouns)
+            for field, default in (("description", ""), ("background", ""), ("alibi", ""),
+                                   ("motive", "No clear motive"))
+        }
+        if not fields["description"] or not fields["background"]:
+            return  # Too tied to its own case to reuse
+        await self.collection.insert_one({
+            "id": str(uuid.uuid4()),
+            "role": key_role,
+            "era": era,
+            **fields,
+            "motive": fields["motive"] or "No clear motive",
+            "source_case_id": case.get("id"),
+            "created_at": datetime.now(),
+        })
+
+    async def instantiate(self, role: str, case: dict) -> Optional[dict]:
+        """Fill an archetype matching the role and case era with case-specific details.
+
+        Returns character data (name, description, background, alibi, motive,
+        archetype_id) or None when the library has no match.
+        """
+        keys = role_keys(role)
+        if not keys:
+            return None
+        era = detect_era(case.get("setting", ""))
+
+        used_ids = [char.get("archetype_id") for char in case.get("characters", []) if char.get("archetype_id")]
+        candidates = []
+        for key_role in keys:
+            candidates = await self.collection.aggregate([
+                {"$match": {"role": key_role, "era": era, "id": {"$nin": used_ids}}},
+                {"$sample": {"size": 1}},
+            ]).to_list(1)
+            if candidates:
+                break
+        if not candidates:
+            return None
+        archetype = candidates[0]
+
+        existing_names = [char["name"] for char in case.get("characters", [])]
+        name = self._pick_name(era, existing_names)
+        first_name, last_name = name.split(" ", 1)
+        victim_name = case.get("victim_name", "the victim")
+        values = {"name": name, "first_name": first_name, "last_name": last_name, "victim": victim_name}
+
+        try:
+            alibi = archetype["alibi"].format(**values)
+            if victim_name not in alibi:
+                alibi = f"{alibi} They insist they never went near {victim_name} that evening.".strip()
+            return {
+                "name": name,
+                "description": archetype["description"].format(**values),
+                "background": archetype["background"].format(**values),
+                "alibi": alibi,
+                "motive": archetype["motive"].format(**values),
+                "archetype_id": archetype["id"],
+            }
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"Skipping malformed archetype {archetype.get('id')}: {e}")
+            return None
+
+    @staticmethod
+    def _pick_name(era: str, existing_names: List[str]) -> str:
+        first_names, last_names = NAME_POOLS.get(era, NAME_POOLS["unspecified"])
+        taken = {name.lower() for name in existing_names}
+        taken_surnames = {name.split()[-1].lower() for name in existing_names if name.split()}
+        for _ in range(20):
+            last_name = random.choice(last_names)
+            name = f"{random.choice(first_names)} {last_name}"
+            if name.lower() not in taken and last_name.split()[-1].lower() not in taken_surnames:
+                return name
+        return f"{random.choice(first_names)} {random.choice(last_names)}"
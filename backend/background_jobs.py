@@ -0,0 +1,186 @@
+"""
+Background Jobs
+
+Tracked replacement for fire-and-forget `asyncio.create_task` work such as
+crime scene image generation. Every job is written to the `background_jobs`
+collection before it starts and carries a lease while a worker runs it, so a
+redeploy or crash no longer silently drops it. Handlers can checkpoint
+progress (e.g. the generated prompt and the FAL request id) so a resumed job
+continues where it stopped instead of paying for the same generation twice.
+
+Shutdown protocol (JobRunner.shutdown):
+1. stop starting jobs; anything submitted afterwards is only persisted
+2. give running jobs until the drain deadline to finish
+3. cancel what is left and release it (status back to "pending", lease
+   cleared) with its last checkpoint, so the next sweep on any worker resumes it
+
+Jobs whose worker died without releasing them are reclaimed once their lease expires.
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+# Longer than any single job should take; a job still "running" after this is orphaned
+JOB_LEASE_SECONDS = 600
+MAX_JOB_ATTEMPTS = 3
+MAX_CONCURRENT_JOBS = 8
+
+
+class Job:
+    """A claimed job as seen by its handler"""
+
+    def __init__(self, runner: "JobRunner", doc: dict):
+        self.runner = runner
+        self.id = doc["id"]
+        self.kind = doc["kind"]
+        self.payload = doc.get("payload", {})
+        self.state = dict(doc.get("state") or {})
+
+    async def checkpoint(self, **state):
+        """Persist progress so a resumed run can skip work that already happened"""
+        self.state.update(state)
+        await self.runner.jobs.update_one(
+            {"id": self.id, "worker": self.runner.worker_id},
+            {"$set": {**{f"state.{k}": v for k, v in state.items()},
+                      "lease_until": self.runner._lease(), "updated_at": datetime.now()}}
+        )
+
+
+class JobRunner:
+    """Runs persisted background jobs on this worker and resumes jobs left behind by others"""
+
+    def __init__(self, db, worker_id: Optional[str] = None, max_concurrent: int = MAX_CONCURRENT_JOBS):
+        self.jobs = db.background_jobs
+        self.worker_id = worker_id or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.max_concurrent = max_concurrent
+        self.handlers: Dict[str, Callable[[Job], Awaitable[None]]] = {}
+        self.draining = False
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def register(self, kind: str, handler: Callable[[Job], Awaitable[None]]):
+        self.handlers[kind] = handler
+
+    async def ensure_indexes(self):
+        await self.jobs.create_index("id", unique=True)
+        await self.jobs.create_index([("status", 1), ("lease_until", 1)])
+
+    def _lease(self) -> datetime:
+        return datetime.now() + timedelta(seconds=JOB_LEASE_SECONDS)
+
+    async def submit(self, kind: str, payload: dict) -> str:
+        """Persist a job and start it here, or only persist it if this worker is shutting down"""
+        now = datetime.now()
+        running = not self.draining and len(self._tasks) < self.max_concurrent
+        doc = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "payload": payload,
+            "state": {},
+            "status": "running" if running else "pending",
+            "attempts": 1 if running else 0,
+            "worker": self.worker_id if running else None,
+            "lease_until": self._lease() if running else None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.jobs.insert_one(dict(doc))
+        if running:
+            self._start(doc)
+        return doc["id"]
+
+    def _start(self, doc: dict):
+        task = asyncio.create_task(self._run(doc))
+        self._tasks[doc["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(doc["id"], None))
+
+    async def _run(self, doc: dict):
+        job = Job(self, doc)
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job kind '{job.kind}'")
+            await handler(job)
+        except asyncio.CancelledError:
+            # Interrupted by shutdown; shutdown() releases the job for another worker
+            raise
+        except Exception as e:
+            print(f"Background job {job.id} ({job.kind}) failed: {e}")
+            status = "failed" if doc.get("attempts", 1) >= MAX_JOB_ATTEMPTS else "pending"
+            await self.jobs.update_one(
+                {"id": job.id, "worker": self.worker_id},
+                {"$set": {"status": status, "error": str(e), "worker": None, "lease_until": None,
+                          "updated_at": datetime.now()}}
+            )
+            return
+        await self.jobs.update_one(
+            {"id": job.id, "worker": self.worker_id},
+            {"$set": {"status": "done", "worker": None, "lease_until": None, "updated_at": datetime.now()}}
+        )
+
+    async def sweep(self) -> int:
+        """Claim pending and orphaned jobs up to the concurrency limit; returns how many were started"""
+        started = 0
+        while not self.draining and len(self._tasks) < self.max_concurrent:
+            now = datetime.now()
+            claim = {"status": "running", "worker": self.worker_id, "lease_until": self._lease(), "updated_at": now}
+            doc = await self.jobs.find_one_and_update(
+                {"kind": {"$in": list(self.handlers)},
+                 "$or": [{"status": "pending"}, {"status": "running", "lease_until": {"$lt": now}}]},
+                {"$set": claim, "$inc": {"attempts": 1}},
+                sort=[("created_at", 1)],
+                projection={"_id": 0},
+            )
+            if doc is None:
+                break
+            doc.update(claim, attempts=doc.get("attempts", 0) + 1)
+            if doc["attempts"] > MAX_JOB_ATTEMPTS:
+                await self.jobs.update_one({"id": doc["id"]}, {"$set": {"status": "failed", "worker": None,
+                                                                       "lease_until": None}})
+                continue
+            print(f"Resuming background job {doc['id']} ({doc['kind']}), attempt {doc['attempts']}")
+            self._start(doc)
+            started += 1
+        return started
+
+    async def _sweep_forever(self, interval: float):
+        while not self.draining:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Error sweeping background jobs: {e}")
+            await asyncio.sleep(interval)
+
+    def start_sweeper(self, interval: float = 30.0):
+        """Resume unfinished jobs now and keep picking up released ones"""
+        self._sweeper = asyncio.create_task(self._sweep_forever(interval))
+
+    async def shutdown(self, timeout: float):
+        """Stop taking work, drain running jobs for up to `timeout` seconds, release the rest"""
+        self.draining = True
+        if self._sweeper:
+            self._sweeper.cancel()
+        tasks = dict(self._tasks)
+        if not tasks:
+            return
+        print(f"Draining {len(tasks)} background jobs (up to {timeout:.0f}s)...")
+        _, unfinished = await asyncio.wait(tasks.values(), timeout=timeout)
+        if not unfinished:
+            return
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        released = [job_id for job_id, task in tasks.items() if task in unfinished]
+        # An interrupted run does not count against the job's attempts
+        await self.jobs.update_many(
+            {"id": {"$in": released}, "worker": self.worker_id, "status": "running"},
+            {"$set": {"status": "pending", "worker": None, "lease_until": None, "updated_at": datetime.now()},
+             "$inc": {"attempts": -1}}
+        )
+        print(f"Released {len(released)} unfinished background jobs for another worker")
+
+    def __len__(self):
+        return len(self._tasks)
@@ -0,0 +1,208 @@
+"""
+Canned Answers
+
+Players ask every suspect the same few questions. Right after a case is
+created, a background job asks the Storyteller AI for one in-character answer
+per suspect for each of COMMON_INTENTS (stored hidden on the case as
+`canned_answers`, with any people each answer mentions). When a question
+matches one of those intents with high confidence, it is answered instantly
+from the stored batch instead of a live model call.
+
+Matching is a small local TF-IDF model over example phrasings of each intent:
+cosine similarity to the best intent must clear MATCH_THRESHOLD and beat the
+runner-up by MATCH_MARGIN, so anything specific or ambiguous still goes to
+the live model. A question is also refused outright if it uses any content
+word outside the matched intent's vocabulary, or any word of the case's
+character, evidence or location names: "Who do you think killed the
+gardener?" asks about the gardener, not about suspicion in general.
+"""
+
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+COMMON_INTENTS: Dict[str, dict] = {
+    "whereabouts": {
+        "question": "Where were you at the time of the murder?",
+        "examples": [
+            "where were you at the time of the murder",
+            "where were you last night",
+            "what were you doing when it happened",
+            "can you account for your whereabouts",
+            "what is your alibi",
+            "do you have an alibi",
+            "where were you between seven and nine",
+        ],
+    },
+    "relationship": {
+        "question": "How did you know the victim?",
+        "examples": [
+            "how did you know the victim",
+            "what was your relationship with the victim",
+            "how well did you know him",
+            "how well did you know her",
+            "were you close to the deceased",
+            "how long have you known the victim",
+        ],
+    },
+    "witnessed": {
+        "question": "Did you see or hear anything unusual?",
+        "examples": [
+            "did you see anything",
+            "did you hear anything unusual",
+            "did you notice anything strange",
+            "did you see anything suspicious that night",
+            "was there anything out of the ordinary",
+        ],
+    },
+    "last_seen": {
+        "question": "When did you last see the victim alive?",
+        "examples": [
+            "when did you last see the victim",
+            "when was the last time you saw him alive",
+            "when was the last time you saw her alive",
+            "when did you last speak to the victim",
+        ],
+    },
+    "suspicion": {
+        "question": "Who do you think did it?",
+        "examples": [
+            "who do you think did it",
+            "who do you suspect",
+            "who would want the victim dead",
+            "do you know who killed him",
+            "do you know who killed her",
+            "did the victim have any enemies",
+        ],
+    },
+}
+
+MATCH_THRESHOLD = 0.6
+MATCH_MARGIN = 0.15
+
+_STOPWORDS = {
+    "a", "an", "the", "you", "your", "i", "me", "my", "to", "of", "at", "in", "on", "and", "or", "is", "was",
+    "were", "be", "it", "that", "this", "please", "tell", "us", "can", "could", "would", "any", "anything",
+    "mr", "mrs", "miss", "ms", "sir", "madam",
+}
+# Words that can pad any common question without changing what it asks
+_NEUTRAL = {
+    "last", "night", "evening", "today", "yesterday", "then", "now", "exactly", "really", "honestly", "ever",
+    "he", "she", "him", "her", "they", "them", "we", "do", "did", "think", "know", "happened", "victim",
+}
+_TOKEN = re.compile(r"[a-z']+")
+
+
+def _tokens(text: str) -> List[str]:
+    return [t.strip("'") for t in _TOKEN.findall(text.lower()) if t.strip("'") not in _STOPWORDS]
+
+
+class IntentMatcher:
+    """TF-IDF nearest-intent classifier over example phrasings"""
+
+    def __init__(self, intents: Dict[str, dict]):
+        documents = [(intent, _tokens(example)) for intent, spec in intents.items() for example in spec["examples"]]
+        doc_freq = Counter(term for _, terms in documents for term in set(terms))
+        self.idf = {term: math.log((1 + len(documents)) / (1 + df)) + 1 for term, df in doc_freq.items()}
+        self.unknown_idf = math.log(1 + len(documents)) + 1
+        self.examples = [(intent, self._vector(terms)) for intent, terms in documents]
+        self.vocabulary: Dict[str, set] = {}
+        for intent, terms in documents:
+            self.vocabulary.setdefault(intent, set(_NEUTRAL)).update(terms)
+
+    def _vector(self, terms: List[str]) -> Dict[str, float]:
+        counts = Counter(terms)
+        vector = {t: c * self.idf.get(t, self.unknown_idf) for t, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {t: v / norm for t, v in vector.items()}
+
+    def scores(self, question: str) -> Dict[str, float]:
+        """Best cosine similarity of the question to each intent's examples"""
+        query = self._vector(_tokens(question))
+        best: Dict[str, float] = {}
+        for intent, example in self.examples:
+            score = sum(weight * example.get(term, 0.0) for term, weight in query.items())
+            best[intent] = max(best.get(intent, 0.0), score)
+        return best
+
+    def match(self, question: str, victim_name: str = "",
+              case_terms: Iterable[str] = ()) -> Optional[Tuple[str, float]]:
+        """The intent a question confidently asks, or None to use the live model
+
+        `case_terms` are the case's name words (characters, evidence, locations); a question using any
+        of them is about something specific.
+
+        >>> intent_matcher.match("Where were you last night?")[0]
+        'whereabouts'
+        >>> intent_matcher.match("Who do you think killed the gardener?") is None
+        True
+        >>> intent_matcher.match("Did you see anything in the library?") is None
+        True
+        >>> intent_matcher.match("Do you have an alibi, Hale?", case_terms=case_terms(["Mary Hale"])) is None
+        True
+        """
+        for name in filter(None, [victim_name, victim_name.split()[-1] if victim_name else ""]):
+            # "How did you know Lord Ashby?" asks the same as "How did you know the victim?"
+            question = re.sub(re.escape(name), "victim", question, flags=re.IGNORECASE)
+        ranked = sorted(self.scores(question).items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < MATCH_THRESHOLD:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < MATCH_MARGIN:
+            return None
+        words = set(_tokens(question))
+        if words - self.vocabulary[ranked[0][0]] or words & set(case_terms):
+            return None
+        return ranked[0]
+
+
+def case_terms(names: Iterable[str]) -> Set[str]:
+    """Content words of a case's names, for `IntentMatcher.match`"""
+    return {t for name in names for t in _tokens(name) if len(t) > 2}
+
+
+intent_matcher = IntentMatcher(COMMON_INTENTS)
+
+
+def build_canned_answers_prompt(case_context: str, cards: Dict[str, str]) -> str:
+    """One Storyteller prompt producing every suspect's answer to every common question"""
+    suspects = "\n\n".join(f"[{character_id}]\n{card}" for character_id, card in cards.items())
+    questions = "\n".join(f'- {intent}: "{spec["question"]}"' for intent, spec in COMMON_INTENTS.items())
+    return f"""{case_context}
+
+SUSPECTS:
+{suspects}
+
+For EACH suspect, write their in-character answer (under 100 words, consistent with their card; the guilty one
+deflects subtly) to each of these questions:
+{questions}
+
+Also list any OTHER people (not the suspects above) each answer mentions, e.g. staff or visitors.
+
+Return ONLY valid JSON keyed by suspect id, then question key:
+{{
+  "<suspect id>": {{
+    "<question key>": {{"answer": "...", "mentions": [{{"role": "gardener", "context": "..."}}]}}
+  }}
+}}"""
+
+
+def parse_canned_answers(response: str, character_ids: List[str]) -> Dict[str, Dict[str, dict]]:
+    """Keep only well-formed answers for known suspects and intents"""
+    data = json.loads(response.strip())
+    answers: Dict[str, Dict[str, dict]] = {}
+    for character_id in character_ids:
+        by_intent = data.get(character_id) or {}
+        kept = {}
+        for intent in COMMON_INTENTS:
+            item = by_intent.get(intent)
+            if isinstance(item, str):
+                item = {"answer": item}
+            if not isinstance(item, dict) or not str(item.get("answer", "")).strip():
+                continue
+            mentions = [m for m in item.get("mentions") or [] if isinstance(m, dict) and m.get("role")]
+            kept[intent] = {"answer": str(item["answer"]).strip(), "mentions": mentions}
+        if kept:
+            answers[character_id] = kept
+    return answers
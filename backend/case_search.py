@@ -0,0 +1,182 @@
+"""
+Case Search
+
+Local BM25 retrieval over everything said and found in a case: stored
+testimony (each question and answer), evidence, and public character
+profiles. Evidence analysis pulls the top-k passages relevant to the theory
+instead of whole transcripts, so its prompt stays the same size however long
+the case has been played, and `/api/cases/{id}/search` exposes the same
+ranking to players.
+
+Testimony is stored in the `case_testimony` collection. Each worker keeps an
+in-memory inverted index per recently searched case: new testimony is added
+to it as it is recorded, testimony recorded by other workers is caught up
+from MongoDB on the next search, and the evidence and character passages are
+rebuilt when the case version changes. Hidden fields (culprit flag, solution)
+are never indexed.
+"""
+
+import math
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from prompt_budget import terms
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Catch-up re-reads this far behind the last testimony seen, for inserts that landed late
+TESTIMONY_LOOKBACK = timedelta(seconds=5)
+
+
+class BM25Index:
+    """Append-only inverted index with Okapi BM25 scoring"""
+
+    def __init__(self):
+        self.passages: List[dict] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: List[int] = []
+        self.total_length = 0
+
+    def add(self, passage: dict):
+        position = len(self.passages)
+        counts = Counter(terms(f"{passage['title']} {passage['text']}"))
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[position] = count
+        self.passages.append(passage)
+        self.lengths.append(sum(counts.values()))
+        self.total_length += self.lengths[-1]
+
+    def search(self, query: str, limit: int = 5, exclude: Set[str] = frozenset()) -> List[dict]:
+        if not self.passages:
+            return []
+        n = len(self.passages)
+        avg_length = self.total_length / n or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, tf in postings.items():
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / avg_length)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for position, score in ranked:
+            passage = self.passages[position]
+            if passage["id"] in exclude:
+                continue
+            results.append({**passage, "score": round(score, 3)})
+            if len(results) >= limit:
+                break
+        return results
+
+
+def case_passages(view) -> List[dict]:
+    """Evidence and public character profile passages for a compiled case view"""
+    passages = [
+        {"kind": "evidence", "id": e.id, "title": e.name,
+         "text": f"{e.description} Found: {e.location_found}. Significance: {e.significance}"}
+        for e in view.evidence
+    ]
+    passages.extend(
+        {"kind": "character", "id": c.id, "title": c.name,
+         "text": " ".join(filter(None, [c.role, c.description, c.background, f"Alibi: {c.alibi}",
+                                        f"Motive: {c.motive}" if c.motive else ""]))}
+        for c in view.characters
+    )
+    return passages
+
+
+def testimony_passage(doc: dict) -> dict:
+    return {"kind": "testimony", "id": doc["id"], "title": f"Testimony of {doc['character_name']}",
+            "text": f"Detective: \"{doc['question']}\" {doc['character_name']}: \"{doc['answer']}\"",
+            "character_id": doc["character_id"]}
+
+
+class _CaseIndex:
+    __slots__ = ("version", "index", "testimony", "seen", "synced_at")
+
+    def __init__(self, view, testimony: List[dict], seen: Set[str], synced_at: Optional[datetime]):
+        self.version = view.version
+        self.index = BM25Index()
+        for passage in case_passages(view) + testimony:
+            self.index.add(passage)
+        self.testimony = testimony
+        self.seen = seen
+        self.synced_at = synced_at
+
+    def add_testimony(self, doc: dict):
+        if doc["id"] in self.seen:
+            return
+        passage = testimony_passage(doc)
+        self.seen.add(doc["id"])
+        self.testimony.append(passage)
+        self.index.add(passage)
+
+
+class CaseSearch:
+    """Per-case BM25 indexes over testimony, evidence and character profiles"""
+
+    def __init__(self, db, views, max_cases: int = 128):
+        self.testimony = db.case_testimony
+        self.views = views
+        self.max_cases = max_cases
+        self._indexes: "OrderedDict[str, _CaseIndex]" = OrderedDict()
+
+    async def ensure_indexes(self):
+        await self.testimony.create_index([("case_id", 1), ("created_at", 1)])
+
+    async def record_testimony(self, case_id: str, character_id: str, character_name: str,
+                               question: str, answer: str):
+        doc = {"id": str(uuid.uuid4()), "case_id": case_id, "character_id": character_id,
+               "character_name": character_name, "question": question, "answer": answer,
+               "created_at": datetime.now()}
+        await self.testimony.insert_one(dict(doc))
+        cached = self._indexes.get(case_id)
+        if cached:
+            cached.add_testimony(doc)
+
+    async def _catch_up(self, case_id: str, cached: Optional[_CaseIndex]) -> List[dict]:
+        query = {"case_id": case_id}
+        if cached and cached.synced_at:
+            # `seen` drops the overlap
+            query["created_at"] = {"$gte": cached.synced_at - TESTIMONY_LOOKBACK}
+        return await self.testimony.find(query, {"_id": 0}).sort("created_at", 1).to_list(None)
+
+    async def index_for(self, case_id: str) -> Optional[_CaseIndex]:
+        view = await self.views.get(case_id)
+        if view is None:
+            self._indexes.pop(case_id, None)
+            return None
+        cached = self._indexes.get(case_id)
+        new_docs = await self._catch_up(case_id, cached)
+        if cached is None or cached.version != view.version:
+            # Evidence or characters changed: rebuild, keeping the testimony already loaded
+            testimony = list(cached.testimony) if cached else []
+            seen = set(cached.seen) if cached else set()
+            cached = _CaseIndex(view, testimony, seen, cached.synced_at if cached else None)
+            self._indexes[case_id] = cached
+        for doc in new_docs:
+            cached.add_testimony(doc)
+        if new_docs:
+            cached.synced_at = new_docs[-1]["created_at"]
+        self._indexes.move_to_end(case_id)
+        while len(self._indexes) > self.max_cases:
+            self._indexes.popitem(last=False)
+        return cached
+
+    async def search(self, case_id: str, query: str, limit: int = 5,
+                     exclude: Set[str] = frozenset()) -> Optional[List[dict]]:
+        """Top passages for `query`, or None if the case does not exist"""
+        cached = await self.index_for(case_id)
+        if cached is None:
+            return None
+        return cached.index.search(query, limit, exclude)
+
+    def stats(self) -> dict:
+        return {"cases": len(self._indexes),
+                "passages": sum(len(c.index.passages) for c in self._indexes.values())}
@@ -0,0 +1,435 @@
+"""
+Case Store
+
+Mutation layer for case documents. Every write bumps a monotonic `version`
+field in the same atomic update, so concurrent `$push`/`$set` operations merge
+in Mongo while caches and clients can detect changes by comparing versions.
+Character discovery, the one multi-step read-then-write, is serialized per case
+with the in-process lock registry below.
+
+Each version also gets an entry in the `case_changes` log describing what it
+appended or set, so clients can fetch just the delta since the version they hold.
+
+Visual scenes and dynamically discovered characters grow without bound over a
+session, so they live in their own `case_scenes` / `case_characters` collections
+(indexed by case and creation time) rather than in the case document, which only
+keeps their counts.
+
+Appends and plain field sets are write-behind batched per case: writes that
+arrive within WRITE_BATCH_DELAY_SECONDS of each other are stored with one
+`insert_many` per child collection and a single merged `$inc`/`$set` on the
+case (one version, one change log entry). Callers still await the flush, so a
+write is durable when the call returns.
+
+Identical concurrent reads (same case, same projection) share one Mongo query
+through a single-flight group; a write stops sharing reads that began before it.
+"""
+
+import asyncio
+import base64
+import copy
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from singleflight import SingleFlight
+
+# Top-level case fields that may be replayed to clients through the change log
+PUBLIC_CHANGE_FIELDS = {"crime_scene_image_url", "title", "setting", "crime_scene_description", "difficulty"}
+
+# How long a missing change log version is treated as "still being written"
+CHANGE_LOG_GAP_GRACE_SECONDS = 5
+
+# Write-behind batching: flush this long after the first queued write, or once this many pile up
+WRITE_BATCH_DELAY_SECONDS = 0.05
+WRITE_BATCH_MAX_WRITES = 20
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Fields stored on scene/character documents that are not part of the API models
+_CHILD_PROJECTION = {"_id": 0, "case_id": 0, "created_at": 0}
+
+
+def _change_entry(case_id: str, version: int, update: dict, appended: Optional[dict] = None) -> dict:
+    """Describe the client-visible effect of an update applied at `version`"""
+    entry = {"case_id": case_id, "version": version, "characters": [], "scenes": [], "fields": {},
+             "created_at": datetime.now()}
+    appended = appended or {}
+    entry["characters"].extend({k: v for k, v in item.items() if k != "is_culprit"}
+                               for item in appended.get("characters", []))
+    entry["scenes"].extend(appended.get("scenes", []))
+    for field, value in update.get("$push", {}).items():
+        items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+        if field == "characters":
+            entry["characters"].extend({k: v for k, v in item.items() if k != "is_culprit"} for item in items)
+        elif field == "visual_scenes":
+            entry["scenes"].extend(items)
+    for field, value in update.get("$set", {}).items():
+        if field in PUBLIC_CHANGE_FIELDS:
+            entry["fields"][field] = value
+    return entry
+
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque pagination cursor pointing just past `doc` in newest-first order"""
+    raw = f"{doc['created_at'].isoformat()}|{doc['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, item_id = raw.split("|", 1)
+    return datetime.fromisoformat(created_at), item_id
+
+
+def _public_child(doc: dict) -> dict:
+    """A queued scene/character document as recorded in the change log"""
+    return {k: v for k, v in doc.items() if k not in ("_id", "case_id", "created_at")}
+
+
+class _LockEntry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class CaseLockRegistry:
+    """In-process asyncio locks keyed by case, dropped as soon as nobody holds or waits on them"""
+
+    def __init__(self):
+        self._entries: Dict[Hashable, _LockEntry] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _LockEntry()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0 and self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _CaseWriteBatch:
+    """Queued writes for one case, merged into a single flush"""
+
+    __slots__ = ("inc", "set", "scenes", "characters", "writes", "waiters", "timer")
+
+    def __init__(self):
+        self.inc: Dict[str, int] = {}
+        self.set: Dict[str, object] = {}
+        self.scenes: List[dict] = []
+        self.characters: List[dict] = []
+        self.writes = 0
+        self.waiters: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class CaseStore:
+    """Versioned reads and writes of cases and their scenes and discovered characters"""
+
+    def __init__(self, db):
+        self.cases = db.cases
+        self.changes = db.case_changes
+        self.scenes = db.case_scenes
+        self.characters = db.case_characters
+        self.listeners: List[Callable[[str, int], None]] = []
+        # Callers mutate the cases they load, so followers get their own copy
+        self.reads = SingleFlight("case_reads", clone=copy.deepcopy)
+        self._batches: Dict[str, _CaseWriteBatch] = {}
+        self._flushes: set = set()
+        self.batched_writes = 0
+        self.batch_flushes = 0
+
+    def add_listener(self, listener: Callable[[str, int], None]):
+        """Call `listener(case_id, version)` after every successful case write"""
+        self.listeners.append(listener)
+
+    async def ensure_indexes(self):
+        await self.cases.create_index("id")
+        await self.changes.create_index([("case_id", 1), ("version", 1)], unique=True)
+        for collection in (self.scenes, self.characters):
+            await collection.create_index([("case_id", 1), ("created_at", -1), ("id", -1)])
+            await collection.create_index("id", unique=True)
+
+    async def insert(self, case: dict):
+        case.setdefault("version", 0)
+        case.pop("visual_scenes", None)
+        case.setdefault("visual_scene_count", 0)
+        case.setdefault("discovered_character_count", 0)
+        await self.cases.insert_one(case)
+        self._written(case["id"])
+
+    def _read_key(self, kind: str, case_id: str, projection: Optional[dict]) -> tuple:
+        return (case_id, kind, tuple(sorted(projection.items())) if projection else None)
+
+    def _written(self, case_id: str):
+        """Reads that started before this write may miss it; later readers must not join them"""
+        self.reads.forget(lambda key: key[0] == case_id)
+
+    async def get(self, case_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.reads.do(
+            self._read_key("get", case_id, projection),
+            lambda: self.cases.find_one({"id": case_id}, projection)
+        )
+
+    async def load(self, case_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        """Get a case with its discovered characters merged into `characters`"""
+        return await self.reads.do(
+            self._read_key("load", case_id, projection),
+            lambda: self._load(case_id, projection)
+        )
+
+    async def _load(self, case_id: str, projection: Optional[dict]) -> Optional[dict]:
+        case = await self.cases.find_one({"id": case_id}, projection)
+        if case is None:
+            return None
+        if projection is None or "characters" in projection:
+            discovered = await self.characters.find(
+                {"case_id": case_id}, _CHILD_PROJECTION
+            ).sort([("created_at", 1), ("id", 1)]).to_list(None)
+            case["characters"] = case.get("characters", []) + discovered
+        return case
+
+    async def add_scene(self, case_id: str, scene: dict) -> Optional[int]:
+        return await self._write_behind(case_id, scenes=[scene])
+
+    async def add_characters(self, case_id: str, characters: List[dict]) -> Optional[int]:
+        if not characters:
+            return await self.get_version(case_id)
+        return await self._write_behind(case_id, characters=characters)
+
+    async def _write_behind(self, case_id: str, fields: Optional[dict] = None, scenes: List[dict] = (),
+                            characters: List[dict] = ()) -> Optional[int]:
+        """Queue a write into the case's pending batch and wait for the batch to be stored"""
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(case_id)
+        if batch is None:
+            batch = self._batches[case_id] = _CaseWriteBatch()
+            batch.timer = loop.call_later(WRITE_BATCH_DELAY_SECONDS, self._flush_soon, case_id)
+
+        now = datetime.now()
+        batch.set.update(fields or {})
+        for scene in scenes:
+            batch.scenes.append({**scene, "case_id": case_id, "created_at": now})
+        for character in characters:
+            batch.characters.append({**character, "case_id": case_id, "created_at": now})
+        if scenes:
+            batch.inc["visual_scene_count"] = batch.inc.get("visual_scene_count", 0) + len(scenes)
+        if characters:
+            batch.inc["discovered_character_count"] = batch.inc.get("discovered_character_count", 0) + len(characters)
+        batch.writes += 1
+        self.batched_writes += 1
+
+        waiter = loop.create_future()
+        batch.waiters.append(waiter)
+        if batch.writes >= WRITE_BATCH_MAX_WRITES:
+            self._flush_soon(case_id)
+        return await waiter
+
+    def _flush_soon(self, case_id: str):
+        batch = self._batches.pop(case_id, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.create_task(self._flush(case_id, batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, case_id: str, batch: _CaseWriteBatch):
+        try:
+            if batch.scenes:
+                await self.scenes.insert_many([dict(doc) for doc in batch.scenes], ordered=False)
+            if batch.characters:
+                await self.characters.insert_many([dict(doc) for doc in batch.characters], ordered=False)
+            update = {}
+            if batch.inc:
+                update["$inc"] = batch.inc
+            if batch.set:
+                update["$set"] = batch.set
+            appended = {
+                "scenes": [_public_child(doc) for doc in batch.scenes],
+                "characters": [_public_child(doc) for doc in batch.characters],
+            }
+            self.batch_flushes += 1
+            version = await self.update(case_id, update, appended=appended)
+        except Exception as e:
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in batch.waiters:
+            if not waiter.done():
+                waiter.set_result(version)
+
+    async def flush_all(self):
+        """Store every queued write now (called at shutdown)"""
+        for case_id in list(self._batches):
+            self._flush_soon(case_id)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def add_alias(self, case_id: str, character_id: str, alias: str) -> Optional[int]:
+        """Record another way testimony referred to a character, as a new case version"""
+        # The changed character goes in the change log so clients replace their copy
+        doc = await self.characters.find_one_and_update(
+            {"case_id": case_id, "id": character_id, "aliases": {"$ne": alias}},
+            {"$addToSet": {"aliases": alias}},
+            return_document=True
+        )
+        if doc is not None:
+            return await self.update(case_id, {}, appended={"characters": [_public_child(doc)]})
+        if await self.characters.count_documents({"case_id": case_id, "id": character_id}, limit=1):
+            return await self.get_version(case_id)  # Already known by this alias
+
+        # An original character, embedded in the case document
+        case = await self.cases.find_one({"id": case_id}, {"_id": 0, "characters": 1})
+        character = next((c for c in (case or {}).get("characters", []) if c["id"] == character_id), None)
+        if character is None or alias in (character.get("aliases") or []):
+            return await self.get_version(case_id)
+        return await self.update(
+            case_id,
+            {"$addToSet": {"characters.$.aliases": alias}},
+            extra_filter={"characters.id": character_id},
+            appended={"characters": [{**character, "aliases": (character.get("aliases") or []) + [alias]}]}
+        )
+
+    async def _page(self, collection, case_id: str, cursor: Optional[str], limit: int,
+                    projection: Optional[dict] = None) -> dict:
+        """Newest-first page of a case's child documents, returned in chronological order"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = {"case_id": case_id}
+        if cursor:
+            created_at, item_id = decode_cursor(cursor)
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "id": {"$lt": item_id}},
+            ]
+        docs = await collection.find(query, {"_id": 0, "case_id": 0, **(projection or {})}).sort(
+            [("created_at", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+
+        next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+        docs = docs[:limit]
+        for doc in docs:
+            doc.pop("created_at", None)
+        docs.reverse()
+        return {"items": docs, "next_cursor": next_cursor}
+
+    async def scene_page(self, case_id: str, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        return await self._page(self.scenes, case_id, cursor, limit)
+
+    async def character_page(self, case_id: str, cursor: Optional[str] = None,
+                             limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        # Discovered characters are never the culprit, but the flag is still not for players
+        return await self._page(self.characters, case_id, cursor, limit, {"is_culprit": 0})
+
+    async def migrate_embedded_scenes(self, case: dict):
+        """Move scenes still embedded in a pre-split case document into `case_scenes`"""
+        embedded = case.get("visual_scenes") or []
+        for scene in embedded:
+            await self.scenes.update_one(
+                {"id": scene["id"]},
+                {"$setOnInsert": {**scene, "case_id": case["id"], "created_at": scene.get("timestamp", datetime.now())}},
+                upsert=True
+            )
+        await self.update(
+            case["id"],
+            {"$unset": {"visual_scenes": ""}, "$inc": {"visual_scene_count": len(embedded)}},
+            extra_filter={"visual_scenes": {"$exists": True}}
+        )
+
+    async def get_version(self, case_id: str) -> Optional[int]:
+        """Current version of a case, or None if it does not exist"""
+        doc = await self.reads.do(
+            (case_id, "version", None),
+            lambda: self.cases.find_one({"id": case_id}, {"_id": 0, "version": 1})
+        )
+        if doc is None:
+            return None
+        return doc.get("version", 0)
+
+    async def update(self, case_id: str, update: dict, extra_filter: Optional[dict] = None,
+                     appended: Optional[dict] = None) -> Optional[int]:
+        """Apply an update and bump the version atomically.
+
+        `appended` lists characters/scenes added or changed as part of this version,
+        for the change log. Returns the new version, or None if no
+        case matched.
+        """
+        query = {"id": case_id}
+        if extra_filter:
+            query.update(extra_filter)
+
+        update = dict(update)
+        update["$inc"] = {**update.get("$inc", {}), "version": 1}
+
+        doc = await self.cases.find_one_and_update(
+            query,
+            update,
+            projection={"_id": 0, "version": 1},
+            return_document=True  # ReturnDocument.AFTER, without importing pymongo at startup
+        )
+        if not doc:
+            return None
+        self._written(case_id)
+
+        try:
+            await self.changes.insert_one(_change_entry(case_id, doc["version"], update, appended))
+        except Exception as e:
+            print(f"Error writing change log for case {case_id} v{doc['version']}: {e}")
+
+        for listener in self.listeners:
+            try:
+                listener(case_id, doc["version"])
+            except Exception as e:
+                print(f"Error in case change listener: {e}")
+        return doc["version"]
+
+    async def changes_since(self, case_id: str, since: int) -> dict:
+        """Merge the logged changes after `since` into one delta.
+
+        Only the contiguous run of versions after `since` is returned, so a log entry
+        still being written by a concurrent request is picked up by the next poll
+        instead of being skipped. `resync` is set when a version has been missing from
+        the log for longer than a write could take, and the client should re-fetch
+        the full case.
+        """
+        entries: List[dict] = await self.changes.find(
+            {"case_id": case_id, "version": {"$gt": since}},
+            {"_id": 0}
+        ).sort("version", 1).to_list(None)
+
+        delta = {"version": since, "characters": [], "visual_scenes": [], "updates": {}, "resync": False}
+        # A character discovered and later given an alias is logged twice; the latest copy wins,
+        # in the place of the first
+        characters: Dict[str, dict] = {}
+        for entry in entries:
+            if entry["version"] != delta["version"] + 1:
+                break
+            delta["version"] = entry["version"]
+            for character in entry.get("characters", []):
+                characters[character["id"]] = character
+            delta["visual_scenes"].extend(entry.get("scenes", []))
+            delta["updates"].update(entry.get("fields", {}))
+        delta["characters"] = list(characters.values())
+
+        if delta["version"] == since and entries:
+            age = (datetime.now() - entries[0]["created_at"]).total_seconds()
+            if age > CHANGE_LOG_GAP_GRACE_SECONDS:
+                delta["version"] = await self.get_version(case_id) or entries[-1]["version"]
+                delta["resync"] = True
+        return delta
+
+    async def set_fields(self, case_id: str, fields: dict) -> Optional[int]:
+        return await self._write_behind(case_id, fields=fields)
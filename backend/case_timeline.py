@@ -0,0 +1,180 @@
+"""
+Case Timeline
+
+A materialized timeline and summary per case, kept in the `case_timelines`
+collection so `GET /api/cases/{id}/timeline` is a single document read
+rather than a live Logic AI call.
+
+Updates are incremental and debounced. Each interrogation (and each newly
+discovered character) touches the case; once it has been quiet for
+TIMELINE_DEBOUNCE_SECONDS - or TIMELINE_MAX_DELAY_SECONDS after the first
+touch, if play never pauses - a `case_timeline` background job runs. The job
+sends the Logic AI the stored timeline plus only the testimony and
+characters added since, and saves the merged result. The stored document
+records which testimony it already covers; a save that lost a race with
+another worker's raises, so the job retries on top of the newer revision.
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+MAX_TIMELINE_EVENTS = 40
+
+# Testimony is re-read this far behind the newest entry covered, for inserts that landed late
+_TESTIMONY_LOOKBACK = timedelta(seconds=5)
+
+
+class TimelineConflict(Exception):
+    """Another worker saved a newer revision first"""
+
+
+class TimelineScheduler:
+    """Debounces change notifications into one update per case"""
+
+    def __init__(self, submit: Callable[[str], Awaitable[None]],
+                 delay: Optional[float] = None, max_delay: Optional[float] = None):
+        # Settings are read here rather than at import, after server.py has loaded backend/.env
+        self.submit = submit
+        self.delay = delay if delay is not None else float(os.environ.get("TIMELINE_DEBOUNCE_SECONDS", "15"))
+        self.max_delay = (max_delay if max_delay is not None
+                          else float(os.environ.get("TIMELINE_MAX_DELAY_SECONDS", "60")))
+        self._pending: Dict[str, Tuple[asyncio.TimerHandle, float]] = {}
+        # Submissions in progress; held here so a pending one is not garbage-collected
+        self._submits: set = set()
+        self.touches = 0
+        self.scheduled = 0
+
+    def touch(self, case_id: str):
+        loop = asyncio.get_running_loop()
+        self.touches += 1
+        now = loop.time()
+        timer, first = self._pending.pop(case_id, (None, now))
+        if timer:
+            timer.cancel()
+        fire_at = min(now + self.delay, first + self.max_delay)
+        self._pending[case_id] = (loop.call_at(fire_at, self._fire, case_id), first)
+
+    def _fire(self, case_id: str):
+        self._pending.pop(case_id, None)
+        self.scheduled += 1
+        task = asyncio.create_task(self._submit(case_id))
+        self._submits.add(task)
+        task.add_done_callback(self._submits.discard)
+
+    async def _submit(self, case_id: str):
+        try:
+            await self.submit(case_id)
+        except Exception as e:
+            print(f"Error scheduling timeline update for case {case_id}: {e}")
+
+    async def flush(self):
+        """Submit every pending update now (at shutdown, so none is lost)"""
+        pending, self._pending = self._pending, {}
+        for case_id, (timer, _) in pending.items():
+            timer.cancel()
+            self.scheduled += 1
+            await self._submit(case_id)
+        if self._submits:
+            await asyncio.gather(*self._submits, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "touches": self.touches, "updates_scheduled": self.scheduled}
+
+
+class CaseTimelines:
+    """Stored timelines and the changes each one has not covered yet"""
+
+    def __init__(self, db):
+        self.timelines = db.case_timelines
+        self.testimony = db.case_testimony
+
+    async def ensure_indexes(self):
+        await self.timelines.create_index("case_id", unique=True)
+
+    async def get(self, case_id: str) -> Optional[dict]:
+        return await self.timelines.find_one({"case_id": case_id}, {"_id": 0})
+
+    async def new_testimony(self, case_id: str, stored: Optional[dict]) -> List[dict]:
+        """Testimony the stored timeline does not cover yet, oldest first"""
+        query = {"case_id": case_id}
+        covered = set()
+        if stored and stored.get("synced_at"):
+            query["created_at"] = {"$gte": stored["synced_at"] - _TESTIMONY_LOOKBACK}
+            covered = {t["id"] for t in stored.get("recent_testimony") or []}
+        docs = await self.testimony.find(query, {"_id": 0}).sort("created_at", 1).to_list(None)
+        return [doc for doc in docs if doc["id"] not in covered]
+
+    async def save(self, case_id: str, stored: Optional[dict], timeline: dict,
+                   testimony: List[dict], character_ids: List[str]):
+        revision = (stored or {}).get("revision", 0)
+        synced_at = testimony[-1]["created_at"] if testimony else (stored or {}).get("synced_at")
+        # Only entries inside the look-back window can be read again, so only those need remembering
+        recent = (stored or {}).get("recent_testimony", []) + [
+            {"id": t["id"], "created_at": t["created_at"]} for t in testimony
+        ]
+        if synced_at:
+            recent = [t for t in recent if t["created_at"] >= synced_at - _TESTIMONY_LOOKBACK]
+        doc = {
+            "case_id": case_id,
+            "summary": timeline["summary"],
+            "events": timeline["events"],
+            "revision": revision + 1,
+            "synced_at": synced_at,
+            "testimony_count": (stored or {}).get("testimony_count", 0) + len(testimony),
+            "recent_testimony": recent,
+            "character_ids": character_ids,
+            "updated_at": datetime.now(),
+        }
+        if stored:
+            result = await self.timelines.replace_one({"case_id": case_id, "revision": revision}, doc)
+            if not result.matched_count:
+                raise TimelineConflict(case_id)
+        else:
+            try:
+                await self.timelines.insert_one(dict(doc))
+            except Exception as e:
+                # Duplicate key: another worker created it first
+                raise TimelineConflict(case_id) from e
+
+
+def build_timeline_prompt(view, stored: Optional[dict], testimony: List[dict], new_characters) -> str:
+    """Logic AI prompt merging only what changed into the stored timeline"""
+    if stored:
+        current = json.dumps({"summary": stored["summary"], "events": stored["events"]}, indent=1)
+        base = f"CURRENT TIMELINE AND SUMMARY (keep what is still right, revise what new facts change):\n{current}"
+    else:
+        base = (f"CASE FACTS:\n{view.crime_scene_description}\nSetting: {view.setting}\n"
+                f"Evidence: {'; '.join(f'{e.name} (found: {e.location_found})' for e in view.evidence)}")
+    people = "\n".join(f"- {c.name}: {c.description}. Claimed alibi: {c.alibi}" for c in new_characters) or "None"
+    statements = "\n".join(
+        f"- Detective asked {t['character_name']}: \"{t['question']}\" Answer: \"{t['answer']}\"" for t in testimony
+    ) or "None"
+    return f"""Maintain the investigation timeline for the case "{view.title}" (victim: {view.victim_name}).
+
+{base}
+
+NEW PEOPLE IN THE INVESTIGATION:
+{people}
+
+NEW TESTIMONY:
+{statements}
+
+Update the timeline with the new information. Order events chronologically, attribute each to its source
+(whose testimony, or which evidence), and note where accounts contradict each other. Do not guess who the
+culprit is. Keep at most {MAX_TIMELINE_EVENTS} events and a summary under 120 words.
+
+Return ONLY valid JSON:
+{{"summary": "...", "events": [{{"time": "around 9 PM", "description": "...", "source": "..."}}]}}"""
+
+
+def parse_timeline(response: str) -> dict:
+    data = json.loads(response.strip())
+    events = [
+        {"time": str(e.get("time") or "unknown"), "description": str(e["description"]).strip(),
+         "source": str(e.get("source") or "")}
+        for e in data.get("events") or [] if isinstance(e, dict) and str(e.get("description") or "").strip()
+    ]
+    return {"summary": str(data.get("summary") or "").strip(), "events": events[:MAX_TIMELINE_EVENTS]}
@@ -0,0 +1,148 @@
+"""
+Case View
+
+Compiled, read-only form of a case used by the request handlers and prompt
+builders. It is built once per case version from the stored document (with
+discovered characters merged in) and cached, so handlers look characters and
+evidence up by id or name in O(1) instead of scanning the raw Mongo dicts, and
+the name lists that every prompt repeats are joined only once.
+
+Views hold hidden fields (`is_culprit`, `solution`, persona cards, canned
+answers, the evidence graph) for prompt building; they are never serialized
+to clients.
+"""
+
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, Iterable, Optional, Tuple
+
+from canned_answers import case_terms
+from evidence_graph import EvidenceGraph
+
+
+class _Record:
+    """Immutable record with __slots__; fields are set once from a document"""
+
+    __slots__ = ()
+
+    def __init__(self, doc: dict):
+        for field in self.__slots__:
+            object.__setattr__(self, field, doc.get(field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def to_dict(self, exclude: Iterable[str] = ()) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__ if field not in exclude}
+
+
+class CharacterRecord(_Record):
+    __slots__ = ("id", "name", "description", "background", "alibi", "motive", "is_culprit", "role", "aliases",
+                 "archetype_id")
+
+
+class EvidenceRecord(_Record):
+    __slots__ = ("id", "name", "description", "location_found", "significance", "is_key_evidence")
+
+
+class CaseView:
+    """Indexed, immutable snapshot of one case version"""
+
+    __slots__ = ("id", "version", "title", "setting", "crime_scene_description", "victim_name", "solution",
+                 "characters", "evidence", "characters_by_id", "characters_by_name", "evidence_by_id",
+                 "character_names", "name_terms", "persona_context", "persona_cards", "canned_answers", "evidence_graph")
+
+    def __init__(self, case: dict):
+        characters: Tuple[CharacterRecord, ...] = tuple(CharacterRecord(c) for c in case.get("characters", []))
+        evidence: Tuple[EvidenceRecord, ...] = tuple(EvidenceRecord(e) for e in case.get("evidence", []))
+        fields = {
+            "id": case["id"],
+            "version": case.get("version", 0),
+            "title": case.get("title", ""),
+            "setting": case.get("setting", ""),
+            "crime_scene_description": case.get("crime_scene_description", ""),
+            "victim_name": case.get("victim_name", ""),
+            "solution": case.get("solution"),
+            "characters": characters,
+            "evidence": evidence,
+            "characters_by_id": MappingProxyType({c.id: c for c in characters}),
+            "characters_by_name": MappingProxyType({c.name: c for c in characters}),
+            "evidence_by_id": MappingProxyType({e.id: e for e in evidence}),
+            # Full name list for mention detection, which must see everyone already known
+            "character_names": ", ".join(c.name for c in characters),
+            # Words of every character, evidence and location name, so canned answers skip specific questions
+            "name_terms": frozenset(case_terms(
+                [c.name for c in characters] + [e.name for e in evidence] + [e.location_found or "" for e in evidence]
+            )),
+            # Compiled at case creation / discovery (see personas.py); absent on older cases
+            "persona_context": case.get("persona_context"),
+            "persona_cards": MappingProxyType(dict(case.get("persona_cards") or {})),
+            # {character_id: {intent: {"answer", "mentions"}}}, filled in by a job after creation
+            "canned_answers": MappingProxyType(dict(case.get("canned_answers") or {})),
+            # Evidence/character relationships, built by a job after creation (see evidence_graph.py)
+            "evidence_graph": EvidenceGraph(case.get("evidence_graph")),
+        }
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CaseView is read-only")
+
+    def character(self, character_id: str) -> Optional[CharacterRecord]:
+        return self.characters_by_id.get(character_id)
+
+    def character_named(self, name: str) -> Optional[CharacterRecord]:
+        return self.characters_by_name.get(name)
+
+    def evidence_items(self, evidence_ids: Iterable[str]) -> Tuple[EvidenceRecord, ...]:
+        """Evidence for the given ids, in the order given; unknown ids are skipped"""
+        return tuple(self.evidence_by_id[i] for i in evidence_ids if i in self.evidence_by_id)
+
+    def archetype_context(self) -> dict:
+        """The case fields the archetype library reads, as a plain dict"""
+        return {
+            "id": self.id,
+            "title": self.title,
+            "setting": self.setting,
+            "victim_name": self.victim_name,
+            "characters": [{"name": c.name, "archetype_id": c.archetype_id} for c in self.characters],
+        }
+
+
+class CaseViewCache:
+    """Compiled views keyed by case, rebuilt when the stored version moves on"""
+
+    def __init__(self, store, max_entries: int = 512):
+        self.store = store
+        self.max_entries = max_entries
+        self._views: "OrderedDict[str, CaseView]" = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+
+    async def get(self, case_id: str) -> Optional[CaseView]:
+        version = await self.store.get_version(case_id)
+        if version is None:
+            self._views.pop(case_id, None)
+            return None
+        view = self._views.get(case_id)
+        if view is not None and view.version >= version:
+            self._views.move_to_end(case_id)
+            self.hits += 1
+            return view
+
+        case = await self.store.load(case_id)
+        if case is None:
+            return None
+        view = CaseView(case)
+        self.builds += 1
+        current = self._views.get(case_id)
+        # A slower concurrent build must not replace a newer view
+        if current is None or current.version <= view.version:
+            self._views[case_id] = view
+            self._views.move_to_end(case_id)
+        while len(self._views) > self.max_entries:
+            self._views.popitem(last=False)
+        return view
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._views), "hits": self.hits, "builds": self.builds}
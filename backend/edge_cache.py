@@ -0,0 +1,65 @@
+"""
+Edge Cache Refresh
+
+nginx micro-caches case and scene reads for a second (see nginx.conf). When a
+case changes, the backend re-requests its main URLs through nginx with
+`X-Cache-Refresh: 1`, which bypasses and replaces the cached copy so players
+see new characters and images immediately instead of after the TTL.
+"""
+
+import asyncio
+import os
+from typing import Optional
+
+REFRESH_PATHS = ("/api/cases/{case_id}", "/api/case-scenes/{case_id}")
+
+
+class EdgeCacheRefresher:
+    """Fire-and-forget refresh of a case's cached URLs after it changes"""
+
+    def __init__(self, base_url: Optional[str] = None):
+        # Where nginx listens, e.g. http://127.0.0.1:8080; EDGE_CACHE_URL is read here rather than at
+        # import, after server.py has loaded backend/.env. Unset disables refreshes (no edge cache in front).
+        base_url = base_url or os.environ.get("EDGE_CACHE_URL")
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self._client = None  # httpx.AsyncClient, opened in start()
+        self._pending = set()
+        # Refreshes in progress; held here so a pending one is not garbage-collected
+        self._tasks: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.base_url is not None
+
+    def case_changed(self, case_id: str, version: int):
+        """CaseStore listener; schedules the refresh without blocking the write"""
+        if not self.enabled or case_id in self._pending:
+            return
+        self._pending.add(case_id)
+        task = asyncio.get_running_loop().create_task(self._refresh(case_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def start(self):
+        """Open the connection pool to nginx (no-op when refreshes are disabled)"""
+        if self.enabled and self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=5.0)
+
+    async def _refresh(self, case_id: str):
+        try:
+            await self.start()
+            # Coalesce bursts of writes to the same case into one refresh
+            await asyncio.sleep(0.05)
+            self._pending.discard(case_id)
+            for path in REFRESH_PATHS:
+                await self._client.get(path.format(case_id=case_id), headers={"X-Cache-Refresh": "1"})
+        except Exception as e:
+            print(f"Error refreshing edge cache for case {case_id}: {e}")
+        finally:
+            self._pending.discard(case_id)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,156 @@
+"""
+Evidence Graph
+
+Relationships between a case's evidence and characters, worked out once by
+the Logic AI right after the case is created (a background job) and stored
+hidden on the case as `evidence_graph`. Evidence analysis then passes only
+the edges touching the player's selection instead of having every call
+rediscover the same connections, and a plain "how do these connect?" about
+the selected evidence is answered from the graph without a model call.
+
+The graph is built from public case fields only (no culprit flag or
+solution), so nothing it says gives away more than the evidence does.
+Nodes are referred to by short aliases (E1, C1) in the prompt to keep it
+small, and mapped back to ids when the reply is parsed.
+"""
+
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Sequence
+
+_STRENGTHS = ("strong", "weak")
+
+# "How do these connect?", "What links the glass and the bag?", "How are they related" - the whole
+# question, nothing after it, so a theory that merely mentions a link is still analysed
+CONNECTION_QUESTION = re.compile(
+    r"^\s*(how|what)\b[\w\s,'-]*\b(connect|connected|connection|connections|relate|related|relationship|link|links"
+    r"|linked|tie|ties|tied)\b[\w\s,'-]*[?.!]*\s*$",
+    re.IGNORECASE,
+)
+MAX_CONNECTION_QUESTION_WORDS = 12
+
+# Anything that turns the question into a theory about who did it
+_ACCUSATION = re.compile(
+    r"\b(if|who|whom|because|since|given|suppose|kill|killed|killer|murder|murdered|murderer|poison|poisoned|"
+    r"guilty|culprit|suspect|suspects|motive|alibi|did it|done it)\b",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def is_connection_question(text: str, character_names: Iterable[str] = ()) -> bool:
+    """Whether `text` only asks how the selected evidence connects (no suspect, no accusation)"""
+    words = _WORD.findall(text.lower())
+    if len(words) > MAX_CONNECTION_QUESTION_WORDS or not CONNECTION_QUESTION.match(text) or _ACCUSATION.search(text):
+        return False
+    name_words = {w for name in character_names for w in _WORD.findall(name.lower()) if len(w) > 2}
+    return not name_words & set(words)
+
+
+def _aliases(view) -> Dict[str, str]:
+    aliases = {f"E{i}": e.id for i, e in enumerate(view.evidence, 1)}
+    aliases.update({f"C{i}": c.id for i, c in enumerate(view.characters, 1)})
+    return aliases
+
+
+def build_evidence_graph_prompt(view) -> str:
+    """One Logic AI prompt relating every piece of evidence to the others and to the characters"""
+    evidence = "\n".join(
+        f"E{i}: {e.name} - {e.description} (found: {e.location_found}; significance: {e.significance})"
+        for i, e in enumerate(view.evidence, 1)
+    )
+    characters = "\n".join(
+        f"C{i}: {c.name} - {c.description}. Alibi: {c.alibi}. Motive: {c.motive or 'none known'}"
+        for i, c in enumerate(view.characters, 1)
+    )
+    return f"""Map the relationships in the detective case "{view.title}" (victim: {view.victim_name}).
+
+EVIDENCE:
+{evidence}
+
+CHARACTERS:
+{characters}
+
+List every meaningful relationship between two pieces of evidence, or between a piece of evidence and a
+character (it belongs to them, places them somewhere, contradicts their alibi, supports their motive...).
+Reason only from the facts above. Describe each relationship in under 20 words.
+
+Return ONLY valid JSON:
+{{"edges": [{{"from": "E1", "to": "C2", "relation": "...", "strength": "strong"}}]}}
+strength is "strong" or "weak"."""
+
+
+def parse_evidence_graph(response: str, view) -> dict:
+    """The stored graph: edges between known nodes, ids in place of aliases, no duplicates"""
+    data = json.loads(response.strip())
+    aliases = _aliases(view)
+    edges, seen = [], set()
+    for item in data.get("edges") or []:
+        if not isinstance(item, dict):
+            continue
+        source, target = aliases.get(str(item.get("from"))), aliases.get(str(item.get("to")))
+        relation = str(item.get("relation") or "").strip()
+        if not source or not target or source == target or not relation:
+            continue
+        if source not in view.evidence_by_id and target not in view.evidence_by_id:
+            continue  # character-to-character links are outside what the graph is for
+        key = frozenset((source, target))
+        if key in seen:
+            continue
+        seen.add(key)
+        strength = item.get("strength") if item.get("strength") in _STRENGTHS else "weak"
+        edges.append({"source": source, "target": target, "relation": relation, "strength": strength})
+    return {"edges": edges}
+
+
+class EvidenceGraph:
+    """Read-only adjacency over the stored edges"""
+
+    __slots__ = ("edges", "_by_node")
+
+    def __init__(self, stored: Optional[dict]):
+        self.edges: Sequence[dict] = tuple((stored or {}).get("edges") or ())
+        self._by_node: Dict[str, List[dict]] = {}
+        for edge in self.edges:
+            self._by_node.setdefault(edge["source"], []).append(edge)
+            self._by_node.setdefault(edge["target"], []).append(edge)
+
+    def __bool__(self):
+        return bool(self.edges)
+
+    def relevant_edges(self, selected: Iterable[str]) -> List[dict]:
+        """Edges touching the selection: those joining two selected nodes first, strong before weak"""
+        selected = set(selected)
+        touching = {id(e): e for node in selected for e in self._by_node.get(node, ())}.values()
+        return sorted(touching, key=lambda e: (not (e["source"] in selected and e["target"] in selected),
+                                               e["strength"] != "strong"))
+
+    def without_people(self, character_ids: Iterable[str], character_names: Iterable[str]) -> "EvidenceGraph":
+        """Only evidence-to-evidence edges whose relation names nobody, safe to show a player as is"""
+        people = set(character_ids)
+        name_words = {w for name in character_names for w in _WORD.findall(name.lower()) if len(w) > 2}
+        return EvidenceGraph({"edges": [
+            edge for edge in self.edges
+            if edge["source"] not in people and edge["target"] not in people
+            and not name_words & set(_WORD.findall(edge["relation"].lower()))
+        ]})
+
+    def _neighbours(self, node: str) -> set:
+        return {e["target"] if e["source"] == node else e["source"] for e in self._by_node.get(node, ())}
+
+    def connects(self, selected: Iterable[str]) -> bool:
+        """Whether every selected node is linked to another selected node, directly or through a shared one"""
+        selected = set(selected)
+        if len(selected) < 2:
+            return False
+        neighbours = {node: self._neighbours(node) for node in selected}
+        return all(
+            neighbours[node] & (selected - {node}) or any(neighbours[node] & neighbours[other]
+                                                         for other in selected - {node})
+            for node in selected
+        )
+
+
+def describe_edge(edge: dict, names: Dict[str, str]) -> str:
+    return (f"- {names.get(edge['source'], edge['source'])} <-> {names.get(edge['target'], edge['target'])}: "
+            f"{edge['relation']} ({edge['strength']})")
@@ -0,0 +1,141 @@
+"""
+Idempotency Keys
+
+Lets clients retry expensive POSTs (case generation, questioning, visual
+scenes) safely by sending an `Idempotency-Key` header. The first request with a
+key claims a record in the `idempotency_keys` collection and runs; its
+successful response is stored there and replayed for any later request with
+the same key. A retry that arrives while the first is still running attaches
+to it: on the same worker it awaits the same computation, on another worker it
+waits for the stored response. Records expire through a TTL index.
+
+A key reused with a different request body is rejected rather than replayed.
+Failed requests release their key so the client can retry with it.
+"""
+
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi.responses import Response
+
+from serialization import FastJSONResponse, dumps
+
+IDEMPOTENCY_TTL_SECONDS = 24 * 3600
+# How long a retry waits for a computation running on another worker
+IN_PROGRESS_WAIT_SECONDS = 120
+# An in-progress record older than this belongs to a worker that died; it may be taken over
+IN_PROGRESS_STALE_SECONDS = 600
+POLL_INTERVAL_SECONDS = 0.5
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyError(Exception):
+    """A key that cannot be honoured; `status_code` is the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def request_fingerprint(*parts) -> str:
+    """Stable hash of the request parameters a key was first used with"""
+    return hashlib.sha256(dumps(parts)).hexdigest()
+
+
+class IdempotencyStore:
+    """Stores and replays responses by (endpoint, Idempotency-Key)"""
+
+    def __init__(self, db):
+        self.records = db.idempotency_keys
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.replays = 0
+
+    async def ensure_indexes(self):
+        await self.records.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+
+    async def run(self, scope: str, key: Optional[str], fingerprint: str,
+                  compute: Callable[[], Awaitable[object]]) -> Response:
+        """Return the response for this key, computing it only if no request with the key ran before"""
+        if not key:
+            return _as_response(await compute())
+
+        record_id = f"{scope}:{key}"
+        task = self._inflight.get(record_id)
+        owner = task is None
+        if owner:
+            task = asyncio.ensure_future(self._execute(record_id, fingerprint, compute))
+            self._inflight[record_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(record_id, None))
+
+        # Shielded so a client disconnect does not cancel work a retry can attach to
+        record, computed_here = await asyncio.shield(task)
+        if record["fingerprint"] != fingerprint:
+            raise IdempotencyError(422, "Idempotency-Key was already used with a different request")
+        replayed = not (owner and computed_here)
+        if replayed:
+            self.replays += 1
+        return _replay(record, replayed)
+
+    async def _execute(self, record_id: str, fingerprint: str, compute) -> tuple:
+        """Claim the key and compute, or wait for whoever holds it; returns (record, computed_here)"""
+        deadline = datetime.now() + timedelta(seconds=IN_PROGRESS_WAIT_SECONDS)
+        while True:
+            now = datetime.now()
+            claim = await self.records.update_one(
+                {"_id": record_id},
+                {"$setOnInsert": {"status": "in_progress", "fingerprint": fingerprint, "created_at": now}},
+                upsert=True
+            )
+            if claim.upserted_id is not None:
+                return await self._compute(record_id, fingerprint, compute), True
+
+            record = await self.records.find_one({"_id": record_id})
+            if record is None:
+                continue  # released by a failed attempt; claim it
+            if record["status"] == "done" or record["fingerprint"] != fingerprint:
+                return record, False
+            if (now - record["created_at"]).total_seconds() > IN_PROGRESS_STALE_SECONDS:
+                # The worker that claimed the key died; take the claim over
+                await self.records.delete_one({"_id": record_id, "created_at": record["created_at"]})
+                continue
+            if now > deadline:
+                raise IdempotencyError(409, "A request with this Idempotency-Key is still being processed")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    async def _compute(self, record_id: str, fingerprint: str, compute) -> dict:
+        try:
+            response = _as_response(await compute())
+        except BaseException:
+            await self.records.delete_one({"_id": record_id})
+            raise
+
+        record = {
+            "_id": record_id,
+            "status": "done",
+            "fingerprint": fingerprint,
+            "status_code": response.status_code,
+            "media_type": response.media_type,
+            "body": bytes(response.body),
+        }
+        if response.status_code < 400:
+            await self.records.update_one(
+                {"_id": record_id},
+                {"$set": {k: v for k, v in record.items() if k != "_id"}}
+            )
+        else:
+            await self.records.delete_one({"_id": record_id})
+        return record
+
+
+def _as_response(result) -> Response:
+    return result if isinstance(result, Response) else FastJSONResponse(result)
+
+
+def _replay(record: dict, replayed: bool) -> Response:
+    headers = {REPLAYED_HEADER: "true"} if replayed else None
+    return Response(content=record["body"], status_code=record["status_code"],
+                    media_type=record.get("media_type"), headers=headers)
@@ -0,0 +1,113 @@
+"""
+Mention Index
+
+Per-case index of the people already known in a case - by role, name variants
+and recorded aliases - used to drop character mentions that refer to someone
+we already have ("the butler", "our butler Jenkins") before a new character is
+generated for them.
+"""
+
+import re
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+from archetypes import normalize_role
+
+# Honorifics ignored when indexing name variants
+NAME_TITLES = {"mr", "mrs", "ms", "miss", "dr", "lord", "lady", "sir", "dame", "madam", "madame",
+               "master", "captain", "colonel", "professor", "prof", "rev", "reverend", "father", "inspector"}
+
+# Roles recognised in an original character's description ("The family physician ...")
+KNOWN_ROLES = {"butler", "cook", "maid", "driver", "gardener", "doctor", "nurse", "housekeeper",
+               "secretary", "governess", "nanny", "footman", "stable hand", "groom", "mailman",
+               "delivery person", "lawyer", "solicitor", "accountant", "bartender", "waiter",
+               "captain", "steward", "guard", "security guard", "receptionist", "neighbor",
+               "neighbour", "priest", "vicar", "detective", "journalist", "photographer", "tutor"}
+
+FUZZY_THRESHOLD = 0.85
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z]+", (text or "").lower())
+
+
+def name_variants(name: str) -> List[str]:
+    """Full name plus the individual name tokens worth matching on ("Jenkins", "Margaret")"""
+    tokens = [w for w in _words(name) if w not in NAME_TITLES and len(w) >= 3]
+    variants = [" ".join(tokens)] if tokens else []
+    variants.extend(tokens)
+    return variants
+
+
+def description_roles(text: str) -> List[str]:
+    """Known roles named in the opening words of a character description"""
+    first_sentence = re.split(r"[.;]", text or "", maxsplit=1)[0]
+    words = _words(first_sentence)[:8]
+    found = set()
+    for size in (2, 1):
+        for i in range(len(words) - size + 1):
+            candidate = normalize_role(" ".join(words[i:i + size]))
+            if candidate in KNOWN_ROLES:
+                found.add(candidate)
+    return sorted(found)
+
+
+class MentionIndex:
+    """Normalized role/name/alias lookup for the characters of a single case"""
+
+    def __init__(self):
+        self.roles: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+
+    @classmethod
+    def from_case(cls, case: dict) -> "MentionIndex":
+        index = cls()
+        for char in case.get("characters", []):
+            index.add(char)
+        return index
+
+    def add(self, char: dict, role: Optional[str] = None):
+        """Index a character's role, name variants and aliases"""
+        char_id = char["id"]
+        roles = [role, char.get("role")] + list(char.get("aliases", []))
+        roles = [normalize_role(r) for r in roles if r]
+        roles.extend(description_roles(char.get("description", "")))
+        for r in roles:
+            if r:
+                self.roles.setdefault(r, char_id)
+        for variant in name_variants(char.get("name", "")):
+            self.names.setdefault(variant, char_id)
+
+    def resolve(self, mention: dict) -> Optional[str]:
+        """Return the id of the known character a mention refers to, if any"""
+        raw_role = mention.get("role", "")
+        role_key = normalize_role(raw_role)
+        if not role_key:
+            return None
+
+        # Exact role or alias ("the butler" -> butler)
+        if role_key in self.roles:
+            return self.roles[role_key]
+
+        # Name variants named in the mention itself ("our butler Jenkins")
+        mention_words = _words(raw_role) + _words(mention.get("name", ""))
+        for word in mention_words:
+            if word in self.names and word not in NAME_TITLES:
+                return self.names[word]
+
+        # Head noun of a qualified role ("head gardener" -> gardener)
+        head = role_key.split()[-1]
+        if head in self.roles:
+            return self.roles[head]
+
+        # Fuzzy match for spelling variants ("gardner", "Jenkin")
+        for key, char_id in list(self.roles.items()):
+            if SequenceMatcher(None, role_key, key).ratio() >= FUZZY_THRESHOLD:
+                return char_id
+        for word in mention_words:
+            if len(word) < 4:
+                continue
+            for key, char_id in self.names.items():
+                if " " not in key and SequenceMatcher(None, word, key).ratio() >= FUZZY_THRESHOLD:
+                    return char_id
+        return None
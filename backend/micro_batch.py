@@ -0,0 +1,147 @@
+"""
+Micro-Batching
+
+Collects small independent jobs submitted by concurrent requests for a few
+milliseconds and processes them in one call, then hands each caller its own
+result. Used for the Logic AI's short classification prompts (mention
+detection, character validation): under load, one multi-item prompt replaces
+many tiny round trips.
+
+Items missing from a batch result, or every item of a batch whose call failed,
+are retried one by one when `isolate_failures` is set, so one bad item cannot
+fail the others.
+
+The classification helpers at the bottom wrap N prompts into one numbered
+prompt and split the reply on its answer markers.
+"""
+
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+
+class MissingBatchResult(Exception):
+    """The batch call returned no result for an item"""
+
+
+class MicroBatcher:
+    """Batches items submitted within `max_wait` seconds, up to `max_items` per call"""
+
+    def __init__(self, name: str,
+                 process_batch: Callable[[List[Any]], Awaitable[Sequence[Optional[Any]]]],
+                 process_one: Callable[[Any], Awaitable[Any]],
+                 max_items: int = 8, max_wait: float = 0.01, isolate_failures: bool = True):
+        # process_batch returns one result per item, None where the item got no usable result
+        self.name = name
+        self.process_batch = process_batch
+        self.process_one = process_one
+        self.max_items = max(1, max_items)
+        self.max_wait = max_wait
+        self.isolate_failures = isolate_failures
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running batch calls; held here so a pending one is not garbage-collected
+        self._runs: set = set()
+        self.batches = 0
+        self.items = 0
+        self.retried_items = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._runs.add(task)
+            task.add_done_callback(self._runs.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        items = [item for item, _ in batch]
+        error: Exception = MissingBatchResult(f"{self.name}: no result for item")
+        try:
+            if len(items) == 1:
+                results = [await self.process_one(items[0])]
+            else:
+                results = list(await self.process_batch(items))
+        except Exception as e:
+            print(f"{self.name} batch of {len(items)} failed: {e}")
+            results, error = [None] * len(items), e
+
+        retries = []
+        for (item, future), result in zip(batch, results + [None] * (len(batch) - len(results))):
+            if future.done():
+                continue
+            if result is not None:
+                future.set_result(result)
+            elif self.isolate_failures and len(batch) > 1:
+                retries.append((item, future))
+            else:
+                future.set_exception(error)
+
+        if retries:
+            self.retried_items += len(retries)
+            await asyncio.gather(*(self._run_one(item, future) for item, future in retries))
+
+    async def _run_one(self, item: Any, future: asyncio.Future):
+        try:
+            result = await self.process_one(item)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "retried_items": self.retried_items,
+            "max_items": self.max_items,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+_ANSWER_MARKER = re.compile(r"^<<<ANSWER (\d+)>>>[ \t]*$", re.MULTILINE)
+
+
+def combine_classification_prompts(prompts: List[str]) -> str:
+    """One prompt asking for independent answers to several numbered tasks"""
+    tasks = "\n\n".join(f"<<<TASK {i}>>>\n{prompt}" for i, prompt in enumerate(prompts, 1))
+    markers = "\n".join(f"<<<ANSWER {i}>>>\n(answer to task {i})" for i in range(1, min(len(prompts), 2) + 1))
+    return f"""You will receive {len(prompts)} independent tasks. Treat each one in isolation: nothing in one task
+applies to another. Answer every task exactly as that task asks (same format it requests).
+
+{tasks}
+
+Reply with each answer under its own marker line, in order, and nothing else:
+{markers}
+..."""
+
+
+def split_classification_answers(response: str, count: int,
+                                 accept: Optional[Callable[[str], bool]] = None) -> List[Optional[str]]:
+    """Answers by task number; None for any task the reply skipped or whose answer `accept` rejects"""
+    answers: List[Optional[str]] = [None] * count
+    matches = list(_ANSWER_MARKER.finditer(response))
+    for position, match in enumerate(matches):
+        number = int(match.group(1))
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(response)
+        text = response[match.end():end].strip()
+        if 1 <= number <= count and text and (accept is None or accept(text)):
+            answers[number - 1] = text
+    return answers
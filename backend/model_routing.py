@@ -0,0 +1,189 @@
+"""
+Model Routing
+
+Maps each kind of AI call the detective service makes (a "route") to a model
+profile: provider, model, max tokens, temperature and timeout. Long-form
+creative writing and analysis keep the flagship models; short JSON
+classification and prompt rewrites go to small, fast ones.
+
+Profiles can be changed at runtime: overrides are stored in the `model_routes`
+collection and every worker reloads them every ROUTE_REFRESH_SECONDS, so a
+switch reaches the whole pool without a redeploy.
+
+Per-route metrics: call count, errors, timeouts, latency (mean/p95 over the
+recent window) and a quality rate - the share of responses the caller could
+use (parsed JSON, a well-formed verdict, a non-empty answer).
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from pydantic import BaseModel, Field
+
+ROUTE_REFRESH_SECONDS = 30
+LATENCY_WINDOW = 200
+
+
+class ModelProfile(BaseModel):
+    provider: str = Field(pattern="^(openai|anthropic)$")
+    model: str
+    max_tokens: int = Field(default=1000, gt=0)
+    temperature: float = Field(default=0.7, ge=0, le=2)
+    timeout: float = Field(default=60, gt=0)
+
+
+_STORYTELLER = "storyteller"
+_LOGIC = "logic"
+
+# Which AI persona (system message) each route speaks as; fixed per route
+ROUTE_ROLES: Dict[str, str] = {
+    "case_generation": _STORYTELLER,
+    "interrogation": _STORYTELLER,
+    "canned_answers": _STORYTELLER,
+    "character_generation": _STORYTELLER,
+    "image_prompt": _STORYTELLER,
+    "mention_detection": _LOGIC,
+    "character_validation": _LOGIC,
+    "evidence_analysis": _LOGIC,
+    "evidence_graph": _LOGIC,
+    "timeline": _LOGIC,
+}
+
+DEFAULT_ROUTES: Dict[str, ModelProfile] = {
+    "case_generation": ModelProfile(provider="openai", model="gpt-4.1", max_tokens=4000, temperature=0.9, timeout=120),
+    "interrogation": ModelProfile(provider="openai", model="gpt-4.1", max_tokens=400, temperature=0.8, timeout=45),
+    "canned_answers": ModelProfile(provider="openai", model="gpt-4.1", max_tokens=4000, temperature=0.8, timeout=120),
+    "character_generation": ModelProfile(provider="openai", model="gpt-4.1-mini", max_tokens=600, temperature=0.8,
+                                         timeout=45),
+    "image_prompt": ModelProfile(provider="openai", model="gpt-4.1-mini", max_tokens=300, temperature=0.7, timeout=30),
+    "mention_detection": ModelProfile(provider="anthropic", model="claude-3-5-haiku-20241022", max_tokens=500,
+                                      temperature=0.0, timeout=20),
+    "character_validation": ModelProfile(provider="anthropic", model="claude-3-5-haiku-20241022", max_tokens=400,
+                                         temperature=0.0, timeout=20),
+    "evidence_analysis": ModelProfile(provider="anthropic", model="claude-sonnet-4-20250514", max_tokens=1500,
+                                      temperature=0.3, timeout=90),
+    "evidence_graph": ModelProfile(provider="anthropic", model="claude-sonnet-4-20250514", max_tokens=3000,
+                                   temperature=0.2, timeout=120),
+    "timeline": ModelProfile(provider="anthropic", model="claude-3-5-haiku-20241022", max_tokens=2500,
+                             temperature=0.2, timeout=60),
+}
+
+
+class RouteMetrics:
+    __slots__ = ("calls", "errors", "timeouts", "latencies", "quality_checks", "quality_ok")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.quality_checks = 0
+        self.quality_ok = 0
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "latency_ms_mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            "latency_ms_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1)
+            if latencies else None,
+            "quality_rate": round(self.quality_ok / self.quality_checks, 3) if self.quality_checks else None,
+        }
+
+
+class UnknownRoute(KeyError):
+    """Raised for a route name that is not in the routing table"""
+
+
+class ModelRouter:
+    """Routing table with runtime overrides from MongoDB and per-route metrics"""
+
+    def __init__(self, defaults: Dict[str, ModelProfile] = DEFAULT_ROUTES):
+        self.defaults = dict(defaults)
+        self.overrides: Dict[str, ModelProfile] = {}
+        self.metrics: Dict[str, RouteMetrics] = {route: RouteMetrics() for route in self.defaults}
+        self.collection = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    def profile(self, route: str) -> ModelProfile:
+        if route not in self.defaults:
+            raise UnknownRoute(route)
+        return self.overrides.get(route) or self.defaults[route]
+
+    def role(self, route: str) -> str:
+        return ROUTE_ROLES[route]
+
+    def table(self) -> Dict[str, dict]:
+        return {
+            route: {**self.profile(route).model_dump(), "role": ROUTE_ROLES[route], "overridden": route in self.overrides}
+            for route in self.defaults
+        }
+
+    # Runtime overrides
+
+    def attach(self, db):
+        self.collection = db.model_routes
+
+    async def reload(self):
+        overrides = {}
+        async for doc in self.collection.find({}, {"_id": 0}):
+            route = doc.pop("route", None)
+            if route not in self.defaults:
+                continue
+            try:
+                overrides[route] = ModelProfile(**doc)
+            except Exception as e:
+                print(f"Ignoring invalid model route override for {route}: {e}")
+        self.overrides = overrides
+
+    async def set_profile(self, route: str, profile: Optional[ModelProfile]):
+        """Store an override for every worker (None restores the default)"""
+        if route not in self.defaults:
+            raise UnknownRoute(route)
+        if profile is None:
+            await self.collection.delete_one({"route": route})
+            self.overrides.pop(route, None)
+        else:
+            await self.collection.update_one({"route": route}, {"$set": {"route": route, **profile.model_dump()}},
+                                             upsert=True)
+            self.overrides[route] = profile
+
+    async def _refresh_forever(self):
+        while True:
+            try:
+                await self.reload()
+            except Exception as e:
+                print(f"Error reloading model routes: {e}")
+            await asyncio.sleep(ROUTE_REFRESH_SECONDS)
+
+    def start_refresh(self):
+        self._refresher = asyncio.create_task(self._refresh_forever())
+
+    def stop_refresh(self):
+        if self._refresher:
+            self._refresher.cancel()
+
+    # Metrics
+
+    def record_call(self, route: str, started: float, error: Optional[BaseException] = None):
+        metrics = self.metrics[route]
+        metrics.calls += 1
+        if isinstance(error, asyncio.TimeoutError):
+            metrics.timeouts += 1
+        elif error is not None:
+            metrics.errors += 1
+        else:
+            metrics.latencies.append(time.perf_counter() - started)
+
+    def record_quality(self, route: str, ok: bool):
+        metrics = self.metrics[route]
+        metrics.quality_checks += 1
+        metrics.quality_ok += int(bool(ok))
+
+    def stats(self) -> Dict[str, dict]:
+        return {route: {"model": self.profile(route).model, **metrics.stats()}
+                for route, metrics in self.metrics.items()}
@@ -0,0 +1,111 @@
+"""
+Persona Cards
+
+Compact, precompiled interrogation context. Instead of resending each
+character's full description, background, alibi and motive plus the whole
+case context and a long rules block on every question, each character gets a
+short persona card compiled once (at case creation, or when a dynamic
+character is discovered) and stored on the case under `persona_cards`, with a
+one-paragraph `persona_context` for the case. Every turn sends only
+PERSONA_RULES, the case context, the card and the question.
+
+Compilation is deterministic trimming (first sentences, word caps), so it
+needs no extra LLM call. Token counts are estimated at ~4 characters per
+token, which is close enough to track the per-turn saving in PersonaStats.
+"""
+
+import re
+from typing import Dict, Iterable, Optional
+
+# Shared rules header, sent once per turn in place of the old per-prompt rules block
+PERSONA_RULES = (
+    "Roleplay a suspect in a detective mystery. Stay in character and consistent with your card. "
+    "Under 150 words, conversational. You may naturally mention other people who were around "
+    "(staff, visitors, family, neighbours). If guilty: never confess easily, deflect with slight "
+    "nervousness. If innocent: helpful, but may guard private secrets."
+)
+
+# Rough size of the rules and instructions the verbose prompt repeated every turn, for the baseline
+VERBOSE_PROMPT_OVERHEAD_TOKENS = 260
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count (~4 characters per token for English prose)"""
+    return (len(text) + 3) // 4
+
+
+def _brief(text: Optional[str], max_words: int) -> str:
+    """First sentence of `text`, capped at `max_words`"""
+    if not text:
+        return ""
+    first = _SENTENCE_END.split(text.strip(), 1)[0]
+    words = first.split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words]).rstrip(",;:") + "..."
+    return first
+
+
+def compile_persona(character: dict) -> str:
+    """Compact persona card for one character"""
+    lines = [f"You are {character['name']}"
+             + (f", the {character['role']}" if character.get("role") else "")
+             + f": {_brief(character.get('description'), 25)}"]
+    background = _brief(character.get("background"), 30)
+    if background:
+        lines.append(f"Background: {background}")
+    lines.append(f"Alibi: {_brief(character.get('alibi'), 30) or 'none given'}")
+    lines.append(f"Motive: {_brief(character.get('motive'), 20) or 'No clear motive'}")
+    lines.append(f"Guilty: {'yes' if character.get('is_culprit') else 'no'}")
+    return "\n".join(lines)
+
+
+def compile_case_context(case: dict) -> str:
+    """One-paragraph case context shared by every persona in the case"""
+    return (f"Case \"{case['title']}\". Victim: {case['victim_name']}. "
+            f"Setting: {_brief(case.get('setting'), 25)} "
+            f"Crime scene: {_brief(case.get('crime_scene_description'), 40)}")
+
+
+def compile_case_personas(case: dict) -> dict:
+    """Persona fields to store on a new case document"""
+    return {
+        "persona_context": compile_case_context(case),
+        "persona_cards": {char["id"]: compile_persona(char) for char in case.get("characters", [])},
+    }
+
+
+def persona_card_fields(characters: Iterable[dict]) -> Dict[str, str]:
+    """`$set` fields adding cards for characters discovered after the case was created"""
+    return {f"persona_cards.{char['id']}": compile_persona(char) for char in characters}
+
+
+def verbose_prompt_tokens(character, case) -> int:
+    """Estimated size of the full-field prompt a turn used to send, as the savings baseline"""
+    fields = [character.description, character.background, character.alibi, character.motive or "",
+              case.title, case.victim_name, case.setting, case.crime_scene_description]
+    return VERBOSE_PROMPT_OVERHEAD_TOKENS + sum(estimate_tokens(f or "") for f in fields)
+
+
+class PersonaStats:
+    """Per-turn prompt sizes with persona cards against the verbose baseline"""
+
+    def __init__(self):
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.baseline_tokens = 0
+
+    def record(self, prompt_tokens: int, baseline_tokens: int):
+        self.turns += 1
+        self.prompt_tokens += prompt_tokens
+        self.baseline_tokens += baseline_tokens
+
+    def stats(self) -> dict:
+        saved = self.baseline_tokens - self.prompt_tokens
+        return {
+            "turns": self.turns,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.turns, 1) if self.turns else 0.0,
+            "avg_baseline_tokens": round(self.baseline_tokens / self.turns, 1) if self.turns else 0.0,
+            "avg_tokens_saved": round(saved / self.turns, 1) if self.turns else 0.0,
+        }
@@ -0,0 +1,365 @@
+"""
+Procedural Cases
+
+Builds complete, solvable mysteries from templates in a few milliseconds
+with no network calls. The generator combines a setting, a victim, four or
+five suspect archetypes, a murder method and an evidence chain.
+
+It is used when the Storyteller AI fails or times out, and for instant cases
+(`POST /api/generate-case?mode=instant`).
+
+Consistency constraints, enforced by construction and rechecked by
+`check_case`:
+- exactly one culprit, and every name in the case is unique;
+- every suspect claims to have been in a different room, none of them the
+  room where the body was found;
+- the method fits the era (no keycard logs in 1925) and the room the body
+  was found in (no curtain cord on a promenade deck);
+- three key pieces of evidence convict the culprit without naming them: the
+  weapon, a personal item at the scene bearing initials only they have, and
+  a record that breaks the alibi of whoever claims the room they named;
+- every suspect has a motive; two innocents also have a red-herring clue at
+  the scene, each offset by a witness note confirming their alibi, so the
+  case has only one answer.
+
+The output has the same shape as the Storyteller's case JSON, plus
+`evidence_links` for the evidence graph (see evidence_graph.py), because
+the generator already knows how its clues connect, and the `method` and
+`crime_room` that `check_case` pairs up.
+"""
+
+import random
+import re
+from typing import Dict, List, Optional
+
+SETTINGS = [
+    {
+        "place": "Blackwood Manor",
+        "setting": "A Victorian mansion on the Yorkshire moors during a thunderstorm, 1920s England",
+        "era": "classic",
+        "victim_role": "the owner of Blackwood Manor",
+        "rooms": ["library", "conservatory", "billiard room", "kitchen", "east gallery", "wine cellar", "music room"],
+        "crime_rooms": ["study", "library", "conservatory"],
+        "record": "the butler's household log",
+        "record_name": "Household Log",
+        "title": "Murder at {place}",
+    },
+    {
+        "place": "the SS Meridian",
+        "setting": "A luxury ocean liner crossing the Atlantic in the 1930s, three days from New York",
+        "era": "classic",
+        "victim_role": "a shipping magnate travelling first class",
+        "rooms": ["promenade deck", "ballroom", "radio room", "first-class lounge", "dining saloon", "card room"],
+        "crime_rooms": ["stateroom", "chart room", "promenade deck"],
+        "record": "the night steward's watch log",
+        "record_name": "Night Steward's Watch Log",
+        "title": "Death Aboard {place}",
+    },
+    {
+        "place": "Hotel Edelweiss",
+        "setting": "A snowed-in alpine ski resort in the Swiss mountains, present day",
+        "era": "modern",
+        "victim_role": "the resort's owner",
+        "rooms": ["spa", "ski lodge bar", "boot room", "observation deck", "games room", "hotel kitchen"],
+        "crime_rooms": ["private office", "wine cellar", "penthouse suite"],
+        "record": "the hotel's keycard access log",
+        "record_name": "Keycard Access Log",
+        "title": "Cold Case at {place}",
+    },
+    {
+        "place": "Chateau Valmont",
+        "setting": "A vineyard estate near Bordeaux during the 1960s harvest festival",
+        "era": "classic",
+        "victim_role": "the head of the Valmont wine house",
+        "rooms": ["tasting room", "barrel hall", "orangery", "ballroom", "chapel", "stables"],
+        "crime_rooms": ["cellar office", "library", "bottling room"],
+        "record": "the estate manager's visitors' book",
+        "record_name": "Visitors' Book",
+        "title": "The Last Vintage at {place}",
+    },
+    {
+        "place": "Lakeview Lodge",
+        "setting": "A remote lakeside lodge hosting a tech company's leadership retreat, present day",
+        "era": "modern",
+        "victim_role": "the company's founder and CEO",
+        "rooms": ["boathouse", "conference room", "sauna", "games room", "kitchen", "fire pit terrace"],
+        "crime_rooms": ["founder's suite", "study loft", "boathouse"],
+        "record": "the lodge's smart-lock access log",
+        "record_name": "Smart-Lock Access Log",
+        "title": "Offline at {place}",
+    },
+]
+
+# Where the body lies in each crime room, and the methods that make sense there
+CRIME_ROOMS = {
+    "study": {"spot": "slumped over the writing desk",
+              "methods": ("poison", "blunt instrument", "stabbing", "strangling", "sedative overdose")},
+    "library": {"spot": "slumped in a reading chair",
+                "methods": ("poison", "blunt instrument", "stabbing", "strangling")},
+    "conservatory": {"spot": "collapsed among the potted palms", "methods": ("poison", "strangling")},
+    "stateroom": {"spot": "slumped over the writing table",
+                  "methods": ("poison", "blunt instrument", "stabbing", "strangling")},
+    "chart room": {"spot": "collapsed across the chart table", "methods": ("poison", "blunt instrument", "stabbing")},
+    "promenade deck": {"spot": "slumped in a deck chair", "methods": ("poison",)},
+    "private office": {"spot": "slumped over the desk",
+                       "methods": ("poison", "blunt instrument", "strangling", "sedative overdose")},
+    "wine cellar": {"spot": "collapsed between the wine racks", "methods": ("poison",)},
+    "penthouse suite": {"spot": "slumped on the sofa",
+                        "methods": ("poison", "blunt instrument", "strangling", "sedative overdose")},
+    "cellar office": {"spot": "slumped over the ledger desk", "methods": ("poison", "blunt instrument", "stabbing")},
+    "bottling room": {"spot": "collapsed beside the bottling line", "methods": ("poison",)},
+    "founder's suite": {"spot": "slumped on the sofa",
+                        "methods": ("poison", "blunt instrument", "strangling", "sedative overdose")},
+    "study loft": {"spot": "slumped over the standing desk",
+                   "methods": ("poison", "blunt instrument", "sedative overdose")},
+    "boathouse": {"spot": "slumped in a chair on the boathouse dock", "methods": ("poison",)},
+}
+
+GIVEN_NAMES = {
+    "classic": ["Arthur", "Margaret", "Edmund", "Beatrice", "Cecil", "Violet", "Reginald", "Evelyn", "Harriet",
+                "Lionel", "Agnes", "Percival", "Constance", "Julian", "Theodora", "Rupert", "Winifred", "Clement"],
+    "modern": ["Alex", "Priya", "Marcus", "Sofia", "Daniel", "Mei", "Jordan", "Elena", "Samir", "Chloe", "Noah",
+               "Aisha", "Lucas", "Hannah", "Mateo", "Ingrid", "Tariq", "Zoe"],
+}
+SURNAMES = ["Ashcombe", "Thornton", "Whitlock", "Carrow", "Fairfax", "Pemberton", "Hale", "Vance", "Morrow",
+            "Delacroix", "Sterling", "Quill", "Harrow", "Lindqvist", "Okafor", "Brandt", "Castellan", "Reyes"]
+
+TIMES = ["half past nine", "a quarter to ten", "ten o'clock", "a quarter past ten", "half past ten", "eleven o'clock"]
+
+# Suspect archetypes; `{victim}` is the victim's name, `{years}` a random number of years
+ARCHETYPES = [
+    {"role": "business partner", "description": "Sharp-suited, impatient and always calculating",
+     "background": "Co-founded the victim's business and has kept its books for {years} years",
+     "motive": "{victim} was about to dissolve the partnership and order a full audit of the accounts",
+     "item": "engraved fountain pen"},
+    {"role": "heir", "family": True, "description": "The victim's charming but restless younger relative",
+     "background": "Came home after years abroad with debts and no prospects",
+     "motive": "Stands to inherit a large share of {victim}'s fortune",
+     "item": "silver cigarette case"},
+    {"role": "physician", "description": "A calm, precise doctor who rarely raises their voice",
+     "background": "Has treated {victim} and the household for {years} years",
+     "motive": "{victim} had discovered forged prescriptions signed in the doctor's hand",
+     "item": "medical bag"},
+    {"role": "secretary", "description": "Quiet, observant and quietly indispensable",
+     "background": "Has handled {victim}'s correspondence, and secrets, for {years} years",
+     "motive": "Was about to be dismissed without a reference after opening a private letter",
+     "item": "shorthand notebook"},
+    {"role": "rival", "description": "A flamboyant competitor with a very public grudge",
+     "background": "Lost a bitter and expensive dispute with {victim} last year",
+     "motive": "{victim}'s testimony in that dispute ruined their reputation",
+     "item": "engraved lighter"},
+    {"role": "spouse", "family": True, "description": "The victim's spouse, poised and guarded",
+     "background": "Married {victim} {years} years ago and has endured a cold marriage since",
+     "motive": "Had just learned of an affair and a newly changed will",
+     "item": "pearl brooch"},
+    {"role": "steward", "description": "Loyal, discreet and seen everywhere without being noticed",
+     "background": "Has run the household staff for {victim} for {years} years",
+     "motive": "Was owed years of unpaid wages that {victim} refused to settle",
+     "item": "ring of keys"},
+    {"role": "artist", "description": "A bohemian painter invited as a guest of honour",
+     "background": "Was commissioned to paint {victim}'s portrait for the occasion",
+     "motive": "{victim} refused to pay and threatened to burn the unfinished portrait",
+     "item": "paint-stained handkerchief"},
+]
+
+# Murder methods; `eras` limits where they fit, `{spot}` and `{crime_room}` say where the body was found
+METHODS = [
+    {"name": "poison", "eras": ("classic", "modern"),
+     "scene": "{victim} found {spot} in the {crime_room}, an overturned glass of brandy beside them",
+     "weapon": ("Poisoned Brandy Glass", "A crystal tumbler with a bitter almond smell and traces of cyanide"),
+     "trace": "a faint white powder residue", "act": "poisoned {victim}'s brandy with cyanide"},
+    {"name": "blunt instrument", "eras": ("classic", "modern"),
+     "scene": "{victim} found {spot} in the {crime_room} with a wound to the head, a heavy bronze bookend nearby",
+     "weapon": ("Bronze Bookend", "A heavy bronze bookend, wiped clean but with a trace of blood in the engraving"),
+     "trace": "a smear of dried blood", "act": "struck {victim} with a bronze bookend"},
+    {"name": "stabbing", "eras": ("classic",),
+     "scene": "{victim} found {spot} in the {crime_room} with an ornate letter opener in their back",
+     "weapon": ("Ornate Letter Opener", "A silver letter opener from the victim's own desk set, blade bloodied"),
+     "trace": "a spatter of blood", "act": "stabbed {victim} with the letter opener from their own desk set"},
+    {"name": "strangling", "eras": ("classic", "modern"),
+     "scene": "{victim} found {spot} in the {crime_room}, a torn silk curtain cord on the floor",
+     "weapon": ("Silk Curtain Cord", "A braided silk cord cut from the curtains, frayed where it was pulled tight"),
+     "trace": "loose silk threads", "act": "strangled {victim} with a cord cut from the curtains"},
+    {"name": "sedative overdose", "eras": ("modern",),
+     "scene": "{victim} found {spot} in the {crime_room}, unresponsive, a half-finished cup of herbal tea beside them",
+     "weapon": ("Tampered Tea Cup", "A cup of herbal tea laced with a crushed prescription sedative"),
+     "trace": "a crushed pill residue", "act": "laced {victim}'s tea with a lethal dose of sedatives"},
+]
+
+
+ALIBI = "Claims to have been in the {room} from before {time} until the body was found"
+_ALIBI_ROOM = re.compile(r"in the (.+?) from before")
+
+
+class ProceduralCaseError(ValueError):
+    """A generated case broke one of the consistency constraints"""
+
+
+def _initials(name: str) -> str:
+    return "".join(f"{part[0]}." for part in name.split())
+
+
+def _title(text: str) -> str:
+    return " ".join(word if word in ("of", "the") else word[0].upper() + word[1:] for word in text.split())
+
+
+def _names(rng: random.Random, era: str, count: int, surname: str, victim_given: str,
+           family_flags: List[bool]) -> List[str]:
+    victim_initials = _initials(f"{victim_given} {surname}")
+    while True:
+        # Initials identify the owner of a clue, so no two people may share them
+        given = rng.sample([g for g in GIVEN_NAMES[era] if g != victim_given], count)
+        others = rng.sample([s for s in SURNAMES if s != surname], count)
+        names = [f"{g} {surname if family else other}" for g, other, family in zip(given, others, family_flags)]
+        initials = [_initials(name) for name in names]
+        if len(set(initials)) == count and victim_initials not in initials:
+            return names
+
+
+def generate_case_data(seed: Optional[int] = None) -> dict:
+    """A complete case in the Storyteller's JSON shape (plus `evidence_links`)"""
+    rng = random.Random(seed)
+    setting = rng.choice(SETTINGS)
+    era = setting["era"]
+    crime_room = rng.choice(setting["crime_rooms"])
+    method = rng.choice([m for m in METHODS if era in m["eras"] and m["name"] in CRIME_ROOMS[crime_room]["methods"]])
+    time_of_death = rng.choice(TIMES)
+
+    surname = rng.choice(SURNAMES)
+    victim_given = rng.choice(GIVEN_NAMES[era])
+    victim_name = f"{victim_given} {surname}"
+
+    count = rng.choice((4, 5))
+    archetypes = rng.sample(ARCHETYPES, count)
+    culprit_index = rng.randrange(count)
+    names = _names(rng, era, count, surname, victim_given, [bool(a.get("family")) for a in archetypes])
+    # Different rooms for every alibi, none of them the crime scene
+    alibi_rooms = rng.sample([r for r in setting["rooms"] if r != crime_room], count)
+
+    characters = []
+    for i, (archetype, name, room) in enumerate(zip(archetypes, names, alibi_rooms)):
+        fill = {"victim": victim_name, "years": rng.randint(3, 25)}
+        characters.append({
+            "name": name,
+            "description": archetype["description"],
+            "background": archetype["background"].format(**fill),
+            "alibi": ALIBI.format(room=room, time=time_of_death),
+            "motive": archetype["motive"].format(**fill),
+            "is_culprit": i == culprit_index,
+        })
+    culprit, culprit_item = characters[culprit_index], archetypes[culprit_index]["item"]
+    culprit_room = alibi_rooms[culprit_index]
+
+    evidence = [
+        {"name": method["weapon"][0], "description": method["weapon"][1],
+         "location_found": f"The {crime_room}", "significance": "The murder weapon",
+         "is_key_evidence": True},
+        {"name": _title(culprit_item),
+         "description": (f"{'An' if culprit_item[0] in 'aeiou' else 'A'} {culprit_item} with the initials {_initials(culprit['name'])} on it, "
+                         f"marked with {method['trace']}"),
+         "location_found": f"Near the body in the {crime_room}",
+         "significance": "Whoever it belongs to was at the scene, whatever they say",
+         "is_key_evidence": True},
+        {"name": setting["record_name"],
+         "description": (f"{setting['record'][0].upper()}{setting['record'][1:]} shows nobody in the "
+                         f"{culprit_room} shortly before {time_of_death}, and someone who had just left it "
+                         f"passing the {crime_room}"),
+         "location_found": "Kept by the staff",
+         "significance": f"Breaks the alibi of whoever claims to have been in the {culprit_room}",
+         "is_key_evidence": True},
+        {"name": "Doctor's Preliminary Report",
+         "description": f"Places the time of death at around {time_of_death}",
+         "location_found": f"Taken from the examination of {victim_name}",
+         "significance": "Fixes when everyone's whereabouts matter",
+         "is_key_evidence": False},
+    ]
+    # (evidence index, "evidence" | "character", index, relation) for the evidence graph. The key clues
+    # link only to each other: an edge to the culprit would name them, and graph answers are shown as is.
+    links = [(1, "evidence", 0, "was found at the scene with"),
+             (2, "evidence", 1, "records a visit to the scene that could explain"),
+             (3, "evidence", 2, "gives the time that makes sense of")]
+
+    innocents = rng.sample([i for i in range(count) if i != culprit_index], 2)
+    for i in innocents:
+        # A red herring: suspicious at first, explained by a second clue
+        item = archetypes[i]["item"]
+        evidence.append({
+            "name": f"{characters[i]['name'].split()[0]}'s {item}",
+            "description": f"{characters[i]['name']}'s {item}, left behind in the {crime_room}",
+            "location_found": f"Near the door of the {crime_room}",
+            "significance": "Suggests another visitor to the room that evening",
+            "is_key_evidence": False,
+        })
+        links.append((len(evidence) - 1, "character", i, "belongs to"))
+    for i in innocents:
+        evidence.append({
+            "name": f"Witness Note: {alibi_rooms[i].title()}",
+            "description": (f"A guest's note confirms {characters[i]['name']} never left the {alibi_rooms[i]} "
+                            f"between nine and eleven"),
+            "location_found": f"The {alibi_rooms[i]}",
+            "significance": f"Supports {characters[i]['name']}'s alibi",
+            "is_key_evidence": False,
+        })
+        links.append((len(evidence) - 1, "character", i, "confirms the alibi of"))
+
+    solution = (f"{culprit['name']} {method['act'].format(victim=victim_name)} in the {crime_room} around "
+                f"{time_of_death}. {culprit['motive']}. {setting['record'][0].upper()}{setting['record'][1:]} "
+                f"shows them near the {crime_room} when they claimed to be in the "
+                f"{culprit_room}, and their {culprit_item} was found at the scene.")
+
+    case = {
+        "title": setting["title"].format(place=setting["place"]),
+        "setting": setting["setting"],
+        "crime_scene_description": method["scene"].format(victim=f"{victim_name}, {setting['victim_role']},",
+                                                          spot=CRIME_ROOMS[crime_room]["spot"], crime_room=crime_room),
+        "victim_name": victim_name,
+        "characters": characters,
+        "evidence": evidence,
+        "solution": solution,
+        "evidence_links": links,
+        "method": method["name"],
+        "crime_room": crime_room,
+    }
+    check_case(case)
+    return case
+
+
+def check_case(case: dict):
+    """Raise ProceduralCaseError if the case breaks a consistency constraint"""
+    characters = case["characters"]
+    culprits = [c for c in characters if c["is_culprit"]]
+    if len(culprits) != 1:
+        raise ProceduralCaseError("a case needs exactly one culprit")
+    names = [c["name"] for c in characters] + [case["victim_name"]]
+    if len(set(names)) != len(names):
+        raise ProceduralCaseError("names must be unique")
+    alibis = [c["alibi"] for c in characters]
+    if len(set(alibis)) != len(alibis):
+        raise ProceduralCaseError("every suspect needs a different alibi")
+    if case["method"] not in CRIME_ROOMS[case["crime_room"]]["methods"]:
+        raise ProceduralCaseError("the method must fit the room the body was found in")
+    culprit = culprits[0]
+    key = " ".join(f"{e['name']} {e['description']} {e['significance']}"
+                   for e in case["evidence"] if e["is_key_evidence"])
+    if re.search(rf"\b({re.escape(culprit['name'])}|{re.escape(culprit['name'].split()[0])})\b", key):
+        raise ProceduralCaseError("key evidence must not name the culprit")
+    initials = [_initials(name) for name in names]
+    room = _ALIBI_ROOM.search(culprit["alibi"]).group(1)
+    if (initials.count(_initials(culprit["name"])) != 1 or _initials(culprit["name"]) not in key
+            or f"in the {room}" not in key):
+        raise ProceduralCaseError("key evidence must point to the culprit")
+    culprit_index = characters.index(culprit)
+    if any(kind == "character" and i == culprit_index for _, kind, i, _ in case.get("evidence_links", [])):
+        raise ProceduralCaseError("the evidence graph must not link clues to the culprit")
+    if not all(c["motive"] for c in characters):
+        raise ProceduralCaseError("every suspect needs a motive")
+
+
+def graph_from_links(case_doc: dict) -> Dict[str, list]:
+    """The stored evidence graph for a generated case, from its known clue links"""
+    nodes = {"evidence": case_doc["evidence"], "character": case_doc["characters"]}
+    return {"edges": [
+        {"source": case_doc["evidence"][e]["id"], "target": nodes[kind][i]["id"],
+         "relation": f"{case_doc['evidence'][e]['name']} {relation} {nodes[kind][i]['name']}", "strength": "strong"}
+        for e, kind, i, relation in case_doc.get("evidence_links", [])
+    ]}
@@ -0,0 +1,87 @@
+"""
+Prompt Budgets
+
+Keeps prompt sections that grow with play (people discovered, characters
+listed for analysis, evidence selected) inside a fixed token budget. When a
+section's items do not all fit, they are ranked by relevance to the current
+question or theory - shared terms, weighted towards rarer ones - and the
+least relevant are dropped, with a short note saying how many were left out.
+Items over the per-item cap are cut at a word boundary.
+
+Budgets are in estimated tokens (see personas.estimate_tokens) and can be
+tuned per section with PROMPT_BUDGET_<SECTION> environment variables.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Iterable, List, Sequence
+
+from personas import estimate_tokens
+
+DEFAULT_BUDGETS = {
+    "others_involved": 80,
+    "available_characters": 300,
+    "selected_evidence": 600,
+    "related_records": 500,
+    "evidence_connections": 300,
+}
+
+
+def section_budget(section: str) -> int:
+    """Token budget for a section; read on use so values from backend/.env (loaded by server.py) apply"""
+    return int(os.environ.get(f"PROMPT_BUDGET_{section.upper()}", DEFAULT_BUDGETS[section]))
+
+
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "by", "for", "with", "from", "is", "was", "were",
+    "be", "been", "it", "its", "that", "this", "you", "your", "i", "me", "my", "he", "she", "his", "her", "they",
+    "them", "their", "did", "do", "does", "what", "who", "where", "when", "why", "how", "about", "as", "but",
+}
+_TERM = re.compile(r"[a-z0-9']+")
+
+
+def terms(text: str) -> List[str]:
+    """Lowercased content words of `text`"""
+    return [t for t in (m.strip("'") for m in _TERM.findall(text.lower())) if t and t not in _STOPWORDS]
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """`text` cut at a word boundary to about `max_tokens`"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4].rsplit(" ", 1)[0]
+    return cut.rstrip(",;:.") + "..."
+
+
+def rank_by_relevance(items: Sequence[str], query: str) -> List[str]:
+    """Items ordered by shared query terms (rarer terms count more); ties keep their order"""
+    query_terms = set(terms(query))
+    if not query_terms:
+        return list(items)
+    item_terms = [set(terms(item)) for item in items]
+    doc_freq = Counter(t for ts in item_terms for t in ts if t in query_terms)
+    weight = {t: math.log((1 + len(items)) / (1 + df)) + 1 for t, df in doc_freq.items()}
+    scores = [sum(weight.get(t, 0.0) for t in ts & query_terms) for ts in item_terms]
+    order = sorted(range(len(items)), key=lambda i: -scores[i])
+    return [items[i] for i in order]
+
+
+def fit_section(items: Iterable[str], budget: int, query: str = "", separator: str = ", ",
+                max_item_tokens: int = 0, overflow: str = "(+{n} more not listed)") -> str:
+    """Join the items that fit in `budget` tokens, most relevant to `query` first"""
+    items = [truncate_tokens(item, max_item_tokens) if max_item_tokens else item for item in items]
+    if estimate_tokens(separator.join(items)) <= budget:
+        return separator.join(items)
+
+    kept: List[str] = []
+    used = 0
+    for item in rank_by_relevance(items, query):
+        cost = estimate_tokens(item + separator)
+        if used + cost > budget:
+            continue
+        kept.append(item)
+        used += cost
+    dropped = len(items) - len(kept)
+    return separator.join(kept + ([overflow.format(n=dropped)] if dropped else []))
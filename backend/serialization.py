@@ -0,0 +1,153 @@
+"""
+Serialization
+
+Fast JSON response path for case reads: an orjson-based response class, Mongo
+projections that drop `_id` and hidden fields at the source, and a cache of
+already-serialized payloads keyed by case version so polling an unchanged case
+skips both the document read and the encoding. ETags are derived from the case
+version, so a revalidation can be answered with 304 before anything is read.
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional, Tuple
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+# Never sent to players: Mongo's ObjectId, the solution, who the culprit is, the
+# persona cards and canned answers (which give it away), and the precomputed evidence graph
+PUBLIC_CASE_PROJECTION = {"_id": 0, "solution": 0, "characters.is_culprit": 0, "persona_cards": 0,
+                          "persona_context": 0, "canned_answers": 0, "evidence_graph": 0}
+
+HIDDEN_SOLUTION = "Hidden until case is solved"
+
+# Case fields a client may select with `fields=`. `solution` and `is_culprit` are never selectable.
+CASE_FIELD_ALLOWLIST = {
+    "id", "title", "setting", "crime_scene_description", "crime_scene_image_url", "victim_name",
+    "characters", "evidence", "visual_scenes", "created_at", "difficulty", "version",
+    "visual_scene_count", "discovered_character_count",
+}
+
+PUBLIC_CHARACTER_FIELDS = ("id", "name", "description", "background", "alibi", "motive", "role", "aliases",
+                           "archetype_id")
+
+# Served from their own collections rather than the case document
+CHILD_FIELDS = {"visual_scenes"}
+
+
+class InvalidFieldSet(ValueError):
+    """Raised when a client asks for a field outside the allowlist"""
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Parse a comma-separated `fields=` value into a sorted, validated field tuple (None = everything)"""
+    if not fields:
+        return None
+    selected = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = selected - CASE_FIELD_ALLOWLIST
+    if unknown:
+        raise InvalidFieldSet(
+            f"Unknown or hidden fields: {', '.join(sorted(unknown))}. "
+            f"Allowed: {', '.join(sorted(CASE_FIELD_ALLOWLIST))}"
+        )
+    # id and version are always returned so clients can key and revalidate the payload
+    return tuple(sorted(selected | {"id", "version"}))
+
+
+def case_projection(fields: Optional[Iterable[str]]) -> dict:
+    """Mongo projection for a field selection; inclusion-only so hidden fields can never leak in"""
+    if fields is None:
+        return PUBLIC_CASE_PROJECTION
+    projection = {"_id": 0}
+    for field in fields:
+        if field in CHILD_FIELDS:
+            continue
+        if field == "characters":
+            projection.update({f"characters.{sub}": 1 for sub in PUBLIC_CHARACTER_FIELDS})
+        else:
+            projection[field] = 1
+    return projection
+
+
+def _default(obj: Any):
+    # ObjectId and anything else orjson does not know natively
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return str(obj)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def raw_json_response(body: bytes, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """Response for a payload that is already JSON-encoded"""
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def version_etag(resource_id: str, version: int, variant: Hashable = "") -> str:
+    """Strong ETag for a versioned resource and response variant (field selection, page...)"""
+    tag = f"{resource_id}:{version}"
+    if variant:
+        tag += ":" + hashlib.sha1(repr(variant).encode()).hexdigest()[:12]
+    return f'"{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header already names this ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Proxies may weaken the tag (W/"...") after compressing the body
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+
+def cache_headers(etag: str) -> dict:
+    # Clients and proxies may store the payload but must revalidate it on every use
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+class CasePayloadCache:
+    """Serialized case payloads, one per (case, variant), valid only for the version they were built from"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, case_id: str, version: int, variant: Hashable = "") -> Optional[bytes]:
+        key = (case_id, variant)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, case_id: str, version: int, body: bytes, variant: Hashable = ""):
+        key = (case_id, variant)
+        self._entries[key] = (version, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
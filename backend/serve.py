@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Production Serving Profile
+
+Runs a supervised pool of uvicorn worker processes for the Detective Game
+backend, one per port starting at BACKEND_BASE_PORT, using uvloop and
+httptools. nginx balances across the pool (see nginx.conf); the list of
+worker addresses is written to NGINX_UPSTREAM_FILE so nginx always matches
+the pool size. Crashed workers are restarted with backoff, and SIGTERM/SIGINT
+are forwarded so every worker shuts down gracefully.
+
+Environment:
+    WEB_CONCURRENCY      number of workers (default: CPU count)
+    BACKEND_BASE_PORT    first worker port (default: 8001)
+    NGINX_UPSTREAM_FILE  where to write nginx `server` lines (default: none)
+    JOB_DRAIN_SECONDS    shutdown time allowed for background jobs (default: 20)
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORKERS = int(os.environ.get("WEB_CONCURRENCY") or os.cpu_count() or 1)
+BASE_PORT = int(os.environ.get("BACKEND_BASE_PORT", "8001"))
+NGINX_UPSTREAM_FILE = os.environ.get("NGINX_UPSTREAM_FILE")
+GRACEFUL_SHUTDOWN_SECONDS = int(os.environ.get("GRACEFUL_SHUTDOWN_SECONDS", "30"))
+# After requests drain, each worker gives background image jobs this long before releasing them
+JOB_DRAIN_SECONDS = int(os.environ.get("JOB_DRAIN_SECONDS", "20"))
+
+MAX_RESTART_BACKOFF = 30
+
+
+def worker_command(port: int) -> list:
+    return [
+        sys.executable, "-m", "uvicorn", "server:app",
+        "--host", "127.0.0.1",
+        "--port", str(port),
+        "--loop", "uvloop",
+        "--http", "httptools",
+        "--no-access-log",
+        "--timeout-keep-alive", "75",  # longer than nginx keeps idle upstream connections
+        "--timeout-graceful-shutdown", str(GRACEFUL_SHUTDOWN_SECONDS),
+    ]
+
+
+def write_upstream_file(ports: list):
+    if not NGINX_UPSTREAM_FILE:
+        return
+    with open(NGINX_UPSTREAM_FILE, "w") as f:
+        for port in ports:
+            f.write(f"server 127.0.0.1:{port} max_fails=2 fail_timeout=10s;\n")
+
+
+class Supervisor:
+    def __init__(self, workers: int, base_port: int):
+        self.ports = [base_port + i for i in range(workers)]
+        self.processes = {}
+        self.restarts = {port: 0 for port in self.ports}
+        self.next_start = {port: 0.0 for port in self.ports}
+        self.stopping = False
+
+    def start(self, port: int):
+        self.processes[port] = subprocess.Popen(worker_command(port), cwd=BACKEND_DIR)
+        print(f"Started backend worker on port {port} (pid {self.processes[port].pid})")
+
+    def stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        print(f"Received signal {signum}, stopping {len(self.processes)} workers...")
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        write_upstream_file(self.ports)
+        for port in self.ports:
+            self.start(port)
+
+        while not self.stopping:
+            time.sleep(1)
+            for port, process in list(self.processes.items()):
+                if process.poll() is None or self.stopping:
+                    continue
+                # Restart crashed workers, backing off if they keep dying
+                now = time.monotonic()
+                if now < self.next_start[port]:
+                    continue
+                self.restarts[port] += 1
+                backoff = min(2 ** self.restarts[port], MAX_RESTART_BACKOFF)
+                print(f"Backend worker on port {port} exited with {process.returncode}, restarting")
+                self.next_start[port] = now + backoff
+                self.start(port)
+
+        # Graceful shutdown: uvicorn drains in-flight requests, then the lifespan
+        # handler drains background jobs and persists whatever is left
+        deadline = time.monotonic() + GRACEFUL_SHUTDOWN_SECONDS + JOB_DRAIN_SECONDS + 5
+        for port, process in self.processes.items():
+            try:
+                process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"Backend worker on port {port} did not stop in time, killing")
+                process.kill()
+        return 0
+
+
+def main():
+    print(f"🕵️ Starting {WORKERS} backend workers on ports {BASE_PORT}-{BASE_PORT + WORKERS - 1} (uvloop + httptools)")
+    sys.exit(Supervisor(WORKERS, BASE_PORT).run())
+
+
+if __name__ == "__main__":
+    main()
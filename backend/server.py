@@ -13,28 +13,174 @@ Author: AI-Generated (Claude-3.5-Sonnet) with human guidance
 License: Proprietary
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+import functools
+import time
 import uuid
 from datetime import datetime
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-import fal_client
 import json
+from archetypes import ArchetypeLibrary, normalize_role
+from background_jobs import Job, JobRunner
+from evidence_graph import (
+    EvidenceGraph,
+    build_evidence_graph_prompt,
+    describe_edge,
+    is_connection_question,
+    parse_evidence_graph,
+)
+from canned_answers import build_canned_answers_prompt, intent_matcher, parse_canned_answers
+from mentions import MentionIndex
+from micro_batch import MicroBatcher, combine_classification_prompts, split_classification_answers
+from model_routing import ModelProfile, ModelRouter, UnknownRoute
+from prompt_budget import fit_section, section_budget
+from procedural_cases import generate_case_data, graph_from_links
+from personas import (
+    PERSONA_RULES,
+    PersonaStats,
+    compile_case_context,
+    compile_case_personas,
+    compile_persona,
+    estimate_tokens,
+    persona_card_fields,
+    verbose_prompt_tokens,
+)
+from singleflight import SingleFlight, singleflight_stats
+from case_store import CaseLockRegistry, CaseStore
+from case_search import CaseSearch
+from case_timeline import CaseTimelines, TimelineScheduler, build_timeline_prompt, parse_timeline
+from case_view import CaseViewCache
+from edge_cache import EdgeCacheRefresher
+from idempotency import IdempotencyError, IdempotencyStore, request_fingerprint
+from serialization import (
+    HIDDEN_SOLUTION,
+    CasePayloadCache,
+    FastJSONResponse,
+    InvalidFieldSet,
+    cache_headers,
+    case_projection,
+    dumps,
+    etag_matches,
+    not_modified,
+    parse_fields,
+    raw_json_response,
+    version_etag,
+)
 
 # Load environment variables
 load_dotenv()
 
+# MongoDB settings; the client itself is created per worker in lifespan()
+mongo_url = os.environ.get("MONGO_URL")
+db_name = os.environ.get("DB_NAME")
+
+# Created in lifespan() once an event loop exists
+mongo_client = None
+db = None
+case_store: Optional[CaseStore] = None
+archetype_library: Optional[ArchetypeLibrary] = None
+image_client = None  # fal_client.AsyncClient, reused for every image request
+job_runner: Optional[JobRunner] = None
+idempotency: Optional[IdempotencyStore] = None
+case_views: Optional[CaseViewCache] = None  # compiled, indexed case snapshots per version
+case_search: Optional[CaseSearch] = None  # BM25 over testimony, evidence and character profiles
+case_timelines: Optional[CaseTimelines] = None  # materialized timeline and summary per case
+
+# How long shutdown waits for background image jobs before releasing them to another worker
+JOB_DRAIN_SECONDS = int(os.environ.get("JOB_DRAIN_SECONDS", "20"))
+
+# In-process state that needs no I/O to set up
+case_locks = CaseLockRegistry()
+case_payloads = CasePayloadCache()
+edge_cache = EdgeCacheRefresher()
+model_router = ModelRouter()  # which model serves each AI call type; overrides load from MongoDB
+# Coalesces bursts of interrogation into one timeline update job per case
+timeline_scheduler = TimelineScheduler(lambda case_id: job_runner.submit("case_timeline", {"case_id": case_id}))
+
+# Required in the X-Admin-Token header to change model routes; unset disables changes
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+async def _create_indexes():
+    """Create indexes in the background so a slow MongoDB does not delay startup"""
+    try:
+        await case_store.ensure_indexes()
+        await archetype_library.ensure_indexes()
+        await job_runner.ensure_indexes()
+        await idempotency.ensure_indexes()
+        await case_search.ensure_indexes()
+        await case_timelines.ensure_indexes()
+    except Exception as e:
+        print(f"Error creating indexes: {e}")
+
+def _check_chat_client():
+    """Refuse to start on a chat client that cannot apply the model routes' generation limits"""
+    from emergentintegrations.llm.chat import LlmChat
+    missing = [method for method in ("with_model", "with_max_tokens", "with_params") if not hasattr(LlmChat, method)]
+    if missing:
+        raise RuntimeError(f"emergentintegrations LlmChat lacks {', '.join(missing)}; model route max_tokens and "
+                           f"temperature cannot be applied. Upgrade emergentintegrations.")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the MongoDB and provider clients once per worker and close them at shutdown"""
+    global mongo_client, db, case_store, archetype_library, image_client, job_runner, idempotency, case_views
+    global case_search, case_timelines
+    
+    # Heavy client libraries are imported here rather than at module import
+    from motor.motor_asyncio import AsyncIOMotorClient
+    _check_chat_client()
+    mongo_client = AsyncIOMotorClient(mongo_url, maxPoolSize=50, minPoolSize=2)
+    db = mongo_client[db_name]
+    case_store = CaseStore(db)
+    case_store.add_listener(edge_cache.case_changed)
+    case_views = CaseViewCache(case_store)
+    case_search = CaseSearch(db, case_views)
+    case_timelines = CaseTimelines(db)
+    archetype_library = ArchetypeLibrary(db)
+    job_runner = JobRunner(db)
+    job_runner.register("crime_scene_image", ai_service.run_crime_scene_job)
+    job_runner.register("canned_answers", ai_service.run_canned_answers_job)
+    job_runner.register("evidence_graph", ai_service.run_evidence_graph_job)
+    job_runner.register("case_timeline", ai_service.run_timeline_job)
+    idempotency = IdempotencyStore(db)
+    model_router.attach(db)
+    
+    if FAL_KEY:
+        import fal_client
+        image_client = fal_client.AsyncClient(key=FAL_KEY)
+    
+    await edge_cache.start()
+    asyncio.create_task(_create_indexes())
+    # Picks up jobs released or orphaned by workers that shut down
+    job_runner.start_sweeper()
+    # Loads model route overrides now and every ROUTE_REFRESH_SECONDS, so switches reach every worker
+    model_router.start_refresh()
+    
+    yield
+    
+    model_router.stop_refresh()
+    # Pending debounced timeline updates become persisted jobs before the runner drains
+    await timeline_scheduler.flush()
+    
+    await job_runner.shutdown(JOB_DRAIN_SECONDS)
+    await case_store.flush_all()
+    await edge_cache.close()
+    mongo_client.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Dual-AI Detective Game API",
     description="Revolutionary detective game with dual-AI intelligence and visual testimony generation",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -44,23 +190,50 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Idempotent-Replayed"],
 )
 
-# MongoDB setup
-mongo_url = os.environ.get("MONGO_URL")
-db_name = os.environ.get("DB_NAME")
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+# Response compression: brotli when the optional package is installed, gzip otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 # AI API Keys
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 FAL_KEY = os.environ.get("FAL_KEY")
 
+# Logic AI classification calls (mention detection, character validation) from concurrent
+# requests are micro-batched into one multi-item prompt
+LOGIC_BATCH_MAX_ITEMS = int(os.environ.get("LOGIC_BATCH_MAX_ITEMS", "8"))
+LOGIC_BATCH_WAIT_MS = float(os.environ.get("LOGIC_BATCH_WAIT_MS", "10"))
+LOGIC_BATCH_ISOLATE_FAILURES = os.environ.get("LOGIC_BATCH_ISOLATE_FAILURES", "true").lower() != "false"
+
 # Set FAL API key for image generation
 if FAL_KEY:
     os.environ["FAL_KEY"] = FAL_KEY
 
+# Testimony/evidence passages retrieved for each evidence analysis
+RELATED_PASSAGES = int(os.environ.get("RELATED_PASSAGES", "5"))
+
+def _is_json_list(answer: str) -> bool:
+    try:
+        return isinstance(json.loads(answer.strip()), list)
+    except ValueError:
+        return False
+
+
+# What a usable answer looks like on each batched Logic AI route
+CLASSIFICATION_CHECKS = {
+    "mention_detection": _is_json_list,
+    "character_validation": lambda answer: "VALID" in answer or "ISSUES" in answer,
+}
+
+# Case fields needed to build image prompts
+CASE_CONTEXT_PROJECTION = {"_id": 0, "title": 1, "setting": 1, "crime_scene_description": 1, "victim_name": 1}
+
 # Data models
 class Character(BaseModel):
     id: str
@@ -70,6 +243,9 @@ class Character(BaseModel):
     alibi: str
     motive: Optional[str] = None
     is_culprit: bool = False
+    archetype_id: Optional[str] = None  # Set when instantiated from the archetype library
+    role: Optional[str] = None  # Role a dynamic character was discovered as ("gardener")
+    aliases: List[str] = []  # Other ways testimony has referred to this character
 
 class Evidence(BaseModel):
     id: str
@@ -102,6 +278,44 @@ class DetectiveCase(BaseModel):
     solution: str
     created_at: datetime
     difficulty: str = "medium"
+    version: int = 0  # Bumped on every mutation; lets caches and clients detect changes
+    visual_scene_count: int = 0  # Scenes live in the case_scenes collection
+    discovered_character_count: int = 0  # Discovered characters live in case_characters
+
+# Trimmed case payload for GET /api/cases/{id}: only these fields reach clients, whatever the stored
+# document holds. Everything but id and version is optional because `fields=` selects a subset.
+class PublicCharacter(BaseModel):
+    id: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    background: Optional[str] = None
+    alibi: Optional[str] = None
+    motive: Optional[str] = None
+    archetype_id: Optional[str] = None
+    role: Optional[str] = None
+    aliases: List[str] = []
+
+class PublicCase(BaseModel):
+    id: str
+    version: int = 0
+    title: Optional[str] = None
+    setting: Optional[str] = None
+    crime_scene_description: Optional[str] = None
+    crime_scene_image_url: Optional[str] = None
+    victim_name: Optional[str] = None
+    characters: Optional[List[PublicCharacter]] = None
+    evidence: Optional[List[Evidence]] = None
+    visual_scenes: Optional[List[VisualScene]] = None
+    solution: Optional[str] = None  # Only ever the HIDDEN_SOLUTION placeholder
+    created_at: Optional[datetime] = None
+    difficulty: Optional[str] = None
+    visual_scene_count: Optional[int] = None
+    discovered_character_count: Optional[int] = None
+    next_scene_cursor: Optional[str] = None
+    next_character_cursor: Optional[str] = None
+
+class CaseResponse(BaseModel):
+    case: PublicCase
 
 class QuestionRequest(BaseModel):
     case_id: str
@@ -113,18 +327,8 @@ class AnalysisRequest(BaseModel):
     evidence_ids: List[str]
     theory: str
 
-# AI Service Class
-class DualAIDetectiveService:
-    def __init__(self):
-        self.storyteller_ai = None  # OpenAI - for creative content
-        self.logic_ai = None        # Claude - for logical analysis
-    
-    async def initialize_storyteller(self, session_id: str):
-        """Initialize OpenAI for creative storytelling"""
-        self.storyteller_ai = LlmChat(
-            api_key=OPENAI_API_KEY,
-            session_id=f"storyteller_{session_id}",
-            system_message="""You are the Storyteller AI in a revolutionary dual-AI detective game. Your role is to create rich, immersive mystery narratives with compelling characters and atmospheric descriptions.
+# System messages for the two AI roles; which role and model a call uses is set by its route (model_routing.py)
+STORYTELLER_SYSTEM_MESSAGE = """You are the Storyteller AI in a revolutionary dual-AI detective game. Your role is to create rich, immersive mystery narratives with compelling characters and atmospheric descriptions.
 
 Your responsibilities:
 - Generate detailed character personalities, backgrounds, and dialogue
@@ -134,14 +338,8 @@ Your responsibilities:
 - Respond in character when suspects are questioned
 
 Always maintain narrative consistency and create content that feels like a premium detective novel."""
-        ).with_model("openai", "gpt-4.1")
-    
-    async def initialize_logic_ai(self, session_id: str):
-        """Initialize Claude for logical analysis"""
-        self.logic_ai = LlmChat(
-            api_key=ANTHROPIC_API_KEY,
-            session_id=f"logic_{session_id}",
-            system_message="""You are the Logic AI in a revolutionary dual-AI detective game. Your role is to provide logical analysis, maintain case consistency, and help players with deductive reasoning.
+
+LOGIC_SYSTEM_MESSAGE = """You are the Logic AI in a revolutionary dual-AI detective game. Your role is to provide logical analysis, maintain case consistency, and help players with deductive reasoning.
 
 Your responsibilities:
 - Analyze evidence relationships and logical connections
@@ -151,12 +349,101 @@ Your responsibilities:
 - Maintain factual consistency throughout the investigation
 
 Always think step-by-step and provide clear, logical reasoning for your conclusions."""
-        ).with_model("anthropic", "claude-sonnet-4-20250514")
+
+# AI Service Class
+class DualAIDetectiveService:
+    def __init__(self):
+        # Identical concurrent requests (several tabs on one case) share a single generation
+        self.scene_flights = SingleFlight("visual_scenes")
+        self.analysis_flights = SingleFlight("evidence_analysis")
+        self.persona_stats = PersonaStats()
+        self.canned_hits = 0
+        self.live_answers = 0
+        self.graph_answers = 0
+        self.procedural_cases = 0
+        # One batcher per classification route, so a batch always goes to that route's model
+        self.classifiers = {
+            route: MicroBatcher(
+                route, functools.partial(self._classify_batch, route), functools.partial(self._classify_one, route),
+                max_items=LOGIC_BATCH_MAX_ITEMS, max_wait=LOGIC_BATCH_WAIT_MS / 1000,
+                isolate_failures=LOGIC_BATCH_ISOLATE_FAILURES
+            )
+            for route in ("mention_detection", "character_validation")
+        }
+    
+    async def _send(self, chat, text: str) -> str:
+        """Send a prompt to an initialized chat"""
+        from emergentintegrations.llm.chat import UserMessage
+        return await chat.send_message(UserMessage(text=text))
+    
+    async def _submit_image(self, arguments: dict, job: Optional[Job] = None) -> Optional[str]:
+        """Run a FAL.AI image generation and return the first image URL.
+
+        With a job, the FAL request id is checkpointed so a resumed job waits for
+        the request already in flight instead of submitting a new one.
+        """
+        if image_client is None:
+            print("Image generation skipped: FAL client not configured")
+            return None
+        request_id = job.state.get("fal_request_id") if job else None
+        if request_id:
+            handler = image_client.get_handle("fal-ai/flux/dev", request_id)
+        else:
+            handler = await image_client.submit("fal-ai/flux/dev", arguments=arguments)
+            if job:
+                await job.checkpoint(fal_request_id=handler.request_id)
+        try:
+            result = await handler.get()
+        except Exception:
+            if job:
+                # The request failed or expired at FAL; the next attempt submits a fresh one
+                await job.checkpoint(fal_request_id=None)
+            raise
+        if result.get("images") and len(result["images"]) > 0:
+            return result["images"][0]["url"]
+        return None
+    
+    def _chat(self, route: str, session_id: str, max_tokens: Optional[int] = None):
+        """A fresh chat for one call, on the model the route is currently mapped to"""
+        from emergentintegrations.llm.chat import LlmChat
+        profile = model_router.profile(route)
+        role = model_router.role(route)
+        chat = LlmChat(
+            api_key=OPENAI_API_KEY if profile.provider == "openai" else ANTHROPIC_API_KEY,
+            session_id=f"{role}_{session_id}",
+            system_message=STORYTELLER_SYSTEM_MESSAGE if role == "storyteller" else LOGIC_SYSTEM_MESSAGE
+        )
+        return (chat.with_model(profile.provider, profile.model)
+                .with_max_tokens(max_tokens or profile.max_tokens)
+                .with_params(temperature=profile.temperature))
+    
+    async def _ask(self, route: str, session_id: str, text: str, max_tokens: Optional[int] = None) -> str:
+        """Send one prompt on a route, bounded by the route's timeout and recorded in its metrics"""
+        chat = self._chat(route, session_id, max_tokens)
+        print(f"{route} prompt: ~{estimate_tokens(text)} tokens")
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self._send(chat, text), model_router.profile(route).timeout)
+        except Exception as e:
+            model_router.record_call(route, started, e)
+            raise
+        model_router.record_call(route, started)
+        return response
+    
+    async def _classify_one(self, route: str, prompt: str) -> str:
+        return await self._ask(route, str(uuid.uuid4()), prompt)
+    
+    async def _classify_batch(self, route: str, prompts: List[str]) -> List[Optional[str]]:
+        # A fresh session per batch so no conversation history leaks between requests. The route's
+        # max_tokens is per answer, so a batch of N gets N times as many.
+        response = await self._ask(route, str(uuid.uuid4()), combine_classification_prompts(prompts),
+                                   max_tokens=model_router.profile(route).max_tokens * len(prompts))
+        # Answers that do not parse (e.g. the last one, cut off at the limit) count as missing and are
+        # retried on their own
+        return split_classification_answers(response, len(prompts), accept=CLASSIFICATION_CHECKS[route])
 
     async def generate_mystery_case(self, session_id: str) -> DetectiveCase:
         """Generate a complete mystery case using the Storyteller AI"""
-        await self.initialize_storyteller(session_id)
-        
         prompt = """Generate a complete detective mystery case with the following structure:
 
 Create a JSON response with:
@@ -196,170 +483,142 @@ Return ONLY valid JSON with this exact structure:
   "solution": "..."
 }"""
 
-        response = await self.storyteller_ai.send_message(UserMessage(text=prompt))
+        try:
+            response = await self._ask("case_generation", session_id, prompt)
+        except Exception as e:
+            # Provider down or slower than the route's timeout: the player still gets a case
+            print(f"Storyteller case generation failed ({e!r}); using a procedural case")
+            return await self.generate_procedural_case()
         
         # Parse the response and create case
         import json
         try:
-            case_data = json.loads(response)
-            
-            # Add IDs and process data
-            case_id = str(uuid.uuid4())
-            characters = []
-            for char in case_data.get("characters", []):
-                characters.append(Character(
-                    id=str(uuid.uuid4()),
-                    name=char["name"],
-                    description=char["description"],
-                    background=char["background"],
-                    alibi=char["alibi"],
-                    motive=char.get("motive"),
-                    is_culprit=char.get("is_culprit", False)
-                ))
-            
-            evidence = []
-            for ev in case_data.get("evidence", []):
-                evidence.append(Evidence(
-                    id=str(uuid.uuid4()),
-                    name=ev["name"],
-                    description=ev["description"],
-                    location_found=ev["location_found"],
-                    significance=ev["significance"],
-                    is_key_evidence=ev.get("is_key_evidence", False)
-                ))
-            
-            case = DetectiveCase(
-                id=case_id,
-                title=case_data["title"],
-                setting=case_data["setting"],
-                crime_scene_description=case_data["crime_scene_description"],
-                crime_scene_image_url=None,  # Will be generated after case creation
-                victim_name=case_data["victim_name"],
-                characters=characters,
-                evidence=evidence,
-                visual_scenes=[],
-                solution=case_data["solution"],
-                created_at=datetime.now()
-            )
-            
-            # Store case in database first
-            await db.cases.insert_one(case.model_dump())
-            
-            # Schedule crime scene image generation in background (non-blocking)
-            asyncio.create_task(self._generate_crime_scene_background(case_id))
-            
-            return case
-            
-        except json.JSONDecodeError:
-            # Fallback case if JSON parsing fails
-            return self._create_fallback_case()
+            case = self._build_case(json.loads(response))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # Fallback case if the JSON is invalid or incomplete (ValueError covers decode and validation errors)
+            model_router.record_quality("case_generation", False)
+            print(f"Unusable Storyteller case ({e!r}); using a procedural case")
+            return await self.generate_procedural_case()
+        model_router.record_quality("case_generation", True)
+        await self._store_new_case(case)
+        return case
     
-    def _create_fallback_case(self) -> DetectiveCase:
-        """Create a fallback mystery case"""
-        case_id = str(uuid.uuid4())
+    def _build_case(self, case_data: dict) -> DetectiveCase:
+        """A DetectiveCase with fresh ids from case JSON (Storyteller or procedural)"""
+        characters = []
+        for char in case_data.get("characters", []):
+            characters.append(Character(
+                id=str(uuid.uuid4()),
+                name=char["name"],
+                description=char["description"],
+                background=char["background"],
+                alibi=char["alibi"],
+                motive=char.get("motive"),
+                is_culprit=char.get("is_culprit", False)
+            ))
+        
+        evidence = []
+        for ev in case_data.get("evidence", []):
+            evidence.append(Evidence(
+                id=str(uuid.uuid4()),
+                name=ev["name"],
+                description=ev["description"],
+                location_found=ev["location_found"],
+                significance=ev["significance"],
+                is_key_evidence=ev.get("is_key_evidence", False)
+            ))
+        
         return DetectiveCase(
-            id=case_id,
-            title="Murder at Blackwood Manor",
-            setting="A Victorian mansion during a thunderstorm in 1920s England",
-            crime_scene_description="Lord Blackwood found dead in his locked study, a glass of brandy spilled beside him",
-            victim_name="Lord Blackwood",
-            characters=[
-                Character(
-                    id=str(uuid.uuid4()),
-                    name="Lady Margaret Blackwood",
-                    description="The victim's wife, elegant but cold",
-                    background="Married Lord Blackwood for his fortune 10 years ago",
-                    alibi="Claims she was reading in her bedroom",
-                    motive="Stands to inherit everything",
-                    is_culprit=False
-                ),
-                Character(
-                    id=str(uuid.uuid4()),
-                    name="Dr. Harrison",
-                    description="The family physician and old friend",
-                    background="Has been treating the family for 20 years",
-                    alibi="Was examining medical equipment in his room",
-                    motive="Lord Blackwood discovered Dr. Harrison's gambling debts",
-                    is_culprit=True
-                )
-            ],
-            evidence=[
-                Evidence(
-                    id=str(uuid.uuid4()),
-                    name="Poisoned Brandy Glass",
-                    description="A crystal glass with traces of cyanide",
-                    location_found="Lord Blackwood's study desk",
-                    significance="The murder weapon",
-                    is_key_evidence=True
-                ),
-                Evidence(
-                    id=str(uuid.uuid4()),
-                    name="Medical Bag",
-                    description="Dr. Harrison's bag with missing cyanide vial",
-                    location_found="Dr. Harrison's guest room",
-                    significance="Contains the poison used in the murder",
-                    is_key_evidence=True
-                )
-            ],
-            solution="Dr. Harrison poisoned Lord Blackwood's brandy with cyanide to prevent exposure of his gambling debts",
+            id=str(uuid.uuid4()),
+            title=case_data["title"],
+            setting=case_data["setting"],
+            crime_scene_description=case_data["crime_scene_description"],
+            crime_scene_image_url=None,  # Will be generated after case creation
+            victim_name=case_data["victim_name"],
+            characters=characters,
+            evidence=evidence,
+            visual_scenes=[],
+            solution=case_data["solution"],
             created_at=datetime.now()
         )
+    
+    async def _store_new_case(self, case: DetectiveCase, evidence_graph: Optional[dict] = None):
+        """Store a new case with its compiled persona cards and schedule its background jobs"""
+        case_doc = case.model_dump()
+        extra = {"evidence_graph": evidence_graph} if evidence_graph else {}
+        await case_store.insert({**case_doc, **compile_case_personas(case_doc), **extra})
+        
+        # Schedule crime scene image generation as a tracked background job (non-blocking)
+        await job_runner.submit("crime_scene_image", {"case_id": case.id})
+        # ...and the batch of answers to the questions every suspect gets asked
+        await job_runner.submit("canned_answers", {"case_id": case.id})
+        # ...and the evidence relationship graph that evidence analysis draws on
+        if not evidence_graph:
+            await job_runner.submit("evidence_graph", {"case_id": case.id})
+    
+    async def generate_procedural_case(self, seed: Optional[int] = None) -> DetectiveCase:
+        """Build and store a case from templates, with no model call (see procedural_cases.py)"""
+        case_data = generate_case_data(seed)
+        case = self._build_case(case_data)
+        # The generator knows how its clues connect, so the evidence graph needs no Logic AI pass
+        graph = graph_from_links({**case.model_dump(), "evidence_links": case_data["evidence_links"]})
+        await self._store_new_case(case, graph)
+        self.procedural_cases += 1
+        return case
 
     async def question_character(self, case_id: str, character_name: str, question: str, session_id: str) -> dict:
         """Have a character respond to questioning using Storyteller AI and detect new character mentions"""
-        await self.initialize_storyteller(session_id)
-        await self.initialize_logic_ai(session_id)
-        
-        # Get case details from database
-        case = await db.cases.find_one({"id": case_id})
+        # Compiled case snapshot for this version
+        case = await case_views.get(case_id)
         if not case:
             return {"error": "Case information not available."}
         
-        # Find the character details
-        character = None
-        for char in case["characters"]:
-            if char["name"] == character_name:
-                character = char
-                break
-        
+        character = case.character_named(character_name)
         if not character:
             return {"error": "Character not found."}
         
-        # Get all existing character names for context
-        existing_names = [char["name"] for char in case["characters"]]
+        # Common questions are answered instantly from the batch generated at case creation
+        canned = case.canned_answers.get(character.id)
+        match = intent_matcher.match(question, case.victim_name, case.name_terms) if canned else None
+        if match and match[0] in canned:
+            self.canned_hits += 1
+            print(f"Answered '{question}' from canned '{match[0]}' answer (score {match[1]:.2f})")
+            return {
+                "response": canned[match[0]]["answer"],
+                "new_character_mentions": canned[match[0]].get("mentions", []),
+                "visual_scene": None
+            }
+        self.live_answers += 1
         
-        prompt = f"""You are roleplaying as {character_name} in the detective mystery "{case['title']}".
-
-CHARACTER CONTEXT:
-- Name: {character['name']}
-- Description: {character['description']}
-- Background: {character['background']}
-- Your alibi: {character['alibi']}
-- Possible motive: {character.get('motive', 'No clear motive')}
-- Are you the culprit: {'Yes' if character.get('is_culprit', False) else 'No'}
-
-CASE CONTEXT:
-- Victim: {case['victim_name']}
-- Setting: {case['setting']}
-- Crime scene: {case['crime_scene_description']}
-- Other people involved: {', '.join(existing_names)}
-
-The detective is asking you: "{question}"
+        # Compact persona card and case context, compiled at creation (older cases compile here)
+        card = case.persona_cards.get(character.id) or compile_persona(character.to_dict())
+        context = case.persona_context or compile_case_context(
+            {"title": case.title, "victim_name": case.victim_name, "setting": case.setting,
+             "crime_scene_description": case.crime_scene_description}
+        )
+        
+        # Bounded as discoveries grow the cast; people the question is about are kept first
+        others = fit_section(
+            [f"{c.name} ({c.role})" if c.role else c.name for c in case.characters if c.id != character.id],
+            section_budget("others_involved"), query=question
+        )
+        
+        prompt = f"""{PERSONA_RULES}
 
-IMPORTANT: You may naturally mention other people who could be relevant to the investigation - staff members, visitors, family, neighbors, etc. Be realistic about who might have been around or involved.
+{context}
+Others involved: {others}
 
-Respond in character with:
-- Personality consistent with your background and description
-- Show appropriate emotions (nervousness if guilty, concern if innocent)
-- Provide helpful information but with realistic evasions if you're hiding something
-- Stay true to your alibi and background
-- If you're the culprit, be subtle - don't confess easily but show slight nervousness
-- If innocent, be helpful but may have your own concerns or secrets
-- Naturally mention other people if relevant (e.g., "The gardener was acting strange that day" or "I saw the cook leaving early")
+{card}
 
-Keep responses conversational, realistic, and under 150 words. Make it feel like a real interrogation."""
+The detective asks: "{question}"
+Respond in character."""
+        
+        prompt_tokens = estimate_tokens(prompt)
+        baseline_tokens = verbose_prompt_tokens(character, case) + estimate_tokens(question)
+        self.persona_stats.record(prompt_tokens, baseline_tokens)
 
-        response = await self.storyteller_ai.send_message(UserMessage(text=prompt))
+        response = await self._ask("interrogation", session_id, prompt)
+        model_router.record_quality("interrogation", bool(response.strip()))
         
         # Now detect if any new characters were mentioned
         detection_prompt = f"""Analyze the following conversation for mentions of NEW people who could potentially be questioned in this detective investigation.
@@ -368,7 +627,7 @@ CONVERSATION:
 Detective: "{question}"
 {character_name}: "{response}"
 
-EXISTING CHARACTERS (do not include these): {', '.join(existing_names)}
+EXISTING CHARACTERS (do not include these): {case.character_names}
 
 Look for mentions of:
 - Staff members (gardener, cook, maid, butler, driver, etc.)
@@ -394,13 +653,14 @@ If no new people are mentioned, return an empty array: []
 
 Return ONLY the JSON array, nothing else."""
 
-        mentions_response = await self.logic_ai.send_message(UserMessage(text=detection_prompt))
+        mentions_response = await self.classifiers["mention_detection"].submit(detection_prompt)
         
         # Parse the mentions
         try:
-            import json
             new_mentions = json.loads(mentions_response.strip())
-        except:
+            model_router.record_quality("mention_detection", isinstance(new_mentions, list))
+        except (json.JSONDecodeError, ValueError):
+            model_router.record_quality("mention_detection", False)
             new_mentions = []
         
         return {
@@ -411,22 +671,26 @@ Return ONLY the JSON array, nothing else."""
 
     async def generate_visual_scene(self, case_id: str, scene_context: str, scene_type: str = "testimony", character_name: str = None) -> Optional[VisualScene]:
         """Generate a visual scene based on testimony or case context"""
+        return await self.scene_flights.do(
+            (case_id, scene_context.strip(), scene_type, character_name),
+            lambda: self._generate_visual_scene(case_id, scene_context, scene_type, character_name)
+        )
+    
+    async def _generate_visual_scene(self, case_id: str, scene_context: str, scene_type: str, character_name: Optional[str]) -> Optional[VisualScene]:
         try:
             # Get case details for context
-            case = await db.cases.find_one({"id": case_id})
+            case = await case_views.get(case_id)
             if not case:
                 return None
             
-            await self.initialize_storyteller(str(uuid.uuid4()))
-            
             # Create detailed prompt for image generation
             prompt_creation = f"""Based on this detective case context, create a detailed visual prompt for image generation:
 
 CASE CONTEXT:
-- Title: {case['title']}
-- Setting: {case['setting']}
-- Crime Scene: {case['crime_scene_description']}
-- Victim: {case['victim_name']}
+- Title: {case.title}
+- Setting: {case.setting}
+- Crime Scene: {case.crime_scene_description}
+- Victim: {case.victim_name}
 
 SCENE TO VISUALIZE:
 {scene_context}
@@ -441,24 +705,18 @@ Create a detailed image generation prompt that includes:
 Return ONLY the image prompt, nothing else. Make it detailed but under 200 words.
 Keep it appropriate for a detective game - dramatic but not graphic."""
 
-            image_prompt = await self.storyteller_ai.send_message(UserMessage(text=prompt_creation))
+            image_prompt = await self._ask("image_prompt", str(uuid.uuid4()), prompt_creation)
+            model_router.record_quality("image_prompt", bool(image_prompt.strip()))
             
             # Generate image using FAL.AI
-            handler = await fal_client.submit_async(
-                "fal-ai/flux/dev",
-                arguments={
-                    "prompt": f"Detective noir style, atmospheric lighting, cinematic composition: {image_prompt.strip()}",
-                    "image_size": "landscape_4_3",
-                    "num_inference_steps": 28,
-                    "guidance_scale": 3.5
-                }
-            )
+            image_url = await self._submit_image({
+                "prompt": f"Detective noir style, atmospheric lighting, cinematic composition: {image_prompt.strip()}",
+                "image_size": "landscape_4_3",
+                "num_inference_steps": 28,
+                "guidance_scale": 3.5
+            })
             
-            result = await handler.get()
-            
-            if result.get("images") and len(result["images"]) > 0:
-                image_url = result["images"][0]["url"]
-                
+            if image_url:
                 # Create scene object
                 scene = VisualScene(
                     id=str(uuid.uuid4()),
@@ -472,10 +730,7 @@ Keep it appropriate for a detective game - dramatic but not graphic."""
                 )
                 
                 # Add scene to case
-                await db.cases.update_one(
-                    {"id": case_id},
-                    {"$push": {"visual_scenes": scene.model_dump()}}
-                )
+                await case_store.add_scene(case_id, scene.model_dump())
                 
                 return scene
             
@@ -485,14 +740,17 @@ Keep it appropriate for a detective game - dramatic but not graphic."""
             print(f"Error generating visual scene: {e}")
             return None
 
-    async def generate_crime_scene_image(self, case_id: str) -> Optional[str]:
-        """Generate the main crime scene image for a case"""
+    async def generate_crime_scene_image(self, case_id: str, job: Optional[Job] = None) -> Optional[str]:
+        """Generate the main crime scene image for a case, resuming from the job's checkpoint if given"""
         try:
-            case = await db.cases.find_one({"id": case_id})
+            case = await case_store.get(case_id, {**CASE_CONTEXT_PROJECTION, "crime_scene_image_url": 1})
             if not case:
                 return None
+            if case.get("crime_scene_image_url"):
+                return case["crime_scene_image_url"]
             
-            await self.initialize_storyteller(str(uuid.uuid4()))
+            if job and job.state.get("image_prompt"):
+                return await self._store_crime_scene_image(case_id, job.state["image_prompt"], job)
             
             # Create detailed crime scene prompt
             prompt_creation = f"""Create a detailed image generation prompt for this crime scene:
@@ -511,55 +769,66 @@ Create a detective noir crime scene image prompt that shows:
 
 Return ONLY the image prompt, nothing else. Make it cinematic and atmospheric."""
 
-            image_prompt = await self.storyteller_ai.send_message(UserMessage(text=prompt_creation))
-            
-            # Generate image using FAL.AI
-            handler = await fal_client.submit_async(
-                "fal-ai/flux/dev",
-                arguments={
-                    "prompt": f"Detective noir crime scene, atmospheric lighting, cinematic mystery: {image_prompt.strip()}",
-                    "image_size": "landscape_4_3",
-                    "num_inference_steps": 28,
-                    "guidance_scale": 3.5
-                }
-            )
-            
-            result = await handler.get()
-            
-            if result.get("images") and len(result["images"]) > 0:
-                image_url = result["images"][0]["url"]
-                
-                # Update case with crime scene image
-                await db.cases.update_one(
-                    {"id": case_id},
-                    {"$set": {"crime_scene_image_url": image_url}}
-                )
-                
-                return image_url
+            image_prompt = await self._ask("image_prompt", str(uuid.uuid4()), prompt_creation)
+            model_router.record_quality("image_prompt", bool(image_prompt.strip()))
+            if job:
+                await job.checkpoint(image_prompt=image_prompt)
             
-            return None
+            return await self._store_crime_scene_image(case_id, image_prompt, job)
             
         except Exception as e:
             print(f"Error generating crime scene image: {e}")
             return None
+    
+    async def _store_crime_scene_image(self, case_id: str, image_prompt: str, job: Optional[Job] = None) -> Optional[str]:
+        """Render the crime scene prompt with FAL.AI and save the URL on the case"""
+        image_url = await self._submit_image({
+            "prompt": f"Detective noir crime scene, atmospheric lighting, cinematic mystery: {image_prompt.strip()}",
+            "image_size": "landscape_4_3",
+            "num_inference_steps": 28,
+            "guidance_scale": 3.5
+        }, job)
+        
+        if image_url:
+            # Update case with crime scene image
+            await case_store.set_fields(case_id, {"crime_scene_image_url": image_url})
+        
+        return image_url
 
     async def generate_dynamic_character(self, case_id: str, role: str, context: str, session_id: str) -> Character:
         """Generate a new character based on a mention in conversation"""
-        await self.initialize_storyteller(session_id)
-        await self.initialize_logic_ai(session_id)
-        
         # Get case details
-        case = await db.cases.find_one({"id": case_id})
+        case = await case_views.get(case_id)
         if not case:
             return None
-            
-        prompt = f"""Create a new character for the detective mystery "{case['title']}" based on this mention:
+        
+        # Instantiate from the archetype library when a matching role/era exists
+        try:
+            archetype_data = await archetype_library.instantiate(role, case.archetype_context())
+        except Exception as e:
+            print(f"Archetype lookup failed, falling back to generation: {e}")
+            archetype_data = None
+        
+        if archetype_data:
+            return Character(
+                id=str(uuid.uuid4()),
+                name=archetype_data["name"],
+                description=archetype_data["description"],
+                background=archetype_data["background"],
+                alibi=archetype_data["alibi"],
+                motive=archetype_data.get("motive"),
+                is_culprit=False,
+                archetype_id=archetype_data["archetype_id"],
+                role=role
+            )
+        
+        prompt = f"""Create a new character for the detective mystery "{case.title}" based on this mention:
 
 CASE CONTEXT:
-- Title: {case['title']}
-- Setting: {case['setting']}
-- Victim: {case['victim_name']}
-- Crime scene: {case['crime_scene_description']}
+- Title: {case.title}
+- Setting: {case.setting}
+- Victim: {case.victim_name}
+- Crime scene: {case.crime_scene_description}
 
 CHARACTER MENTION:
 - Role: {role}
@@ -582,18 +851,23 @@ Return ONLY a JSON object with this structure:
   "motive": "Potential reason they might be involved (or 'No clear motive')"
 }}"""
 
-        response = await self.storyteller_ai.send_message(UserMessage(text=prompt))
+        response = await self._ask("character_generation", session_id, prompt)
         
         # Parse the character data
         try:
             import json
-            char_data = json.loads(response.strip())
+            try:
+                char_data = json.loads(response.strip())
+            except json.JSONDecodeError:
+                model_router.record_quality("character_generation", False)
+                raise
+            model_router.record_quality("character_generation", True)
             
             # Validate with Logic AI
             validation_prompt = f"""Review this dynamically generated character for logical consistency:
 
-CASE: {case['title']}
-SETTING: {case['setting']}
+CASE: {case.title}
+SETTING: {case.setting}
 NEW CHARACTER: {json.dumps(char_data, indent=2)}
 ORIGINAL MENTION: "{context}"
 
@@ -609,7 +883,8 @@ If issues found, suggest improvements in this format:
 ISSUES: [list problems]
 SUGGESTIONS: [improvements]"""
 
-            validation = await self.logic_ai.send_message(UserMessage(text=validation_prompt))
+            validation = await self.classifiers["character_validation"].submit(validation_prompt)
+            model_router.record_quality("character_validation", "VALID" in validation or "ISSUES" in validation)
             
             if "VALID" in validation:
                 character = Character(
@@ -619,8 +894,16 @@ SUGGESTIONS: [improvements]"""
                     background=char_data["background"],
                     alibi=char_data["alibi"],
                     motive=char_data.get("motive"),
-                    is_culprit=False  # Dynamic characters are never the original culprit
+                    is_culprit=False,  # Dynamic characters are never the original culprit
+                    role=role
                 )
+                
+                # Validated characters seed the archetype library for future cases
+                try:
+                    await archetype_library.record(role, case.archetype_context(), char_data)
+                except Exception as e:
+                    print(f"Error recording character archetype: {e}")
+                
                 return character
             else:
                 print(f"Character validation failed: {validation}")
@@ -630,31 +913,116 @@ SUGGESTIONS: [improvements]"""
             print(f"Error generating dynamic character: {e}")
             return None
 
+    async def discover_characters(self, case_id: str, mentions: List[dict], session_id: str) -> List[dict]:
+        """Turn character mentions into new characters, skipping anyone already known in the case.
+
+        Discovery for a case is single-flight: concurrent interrogations wait for each other
+        so the same person mentioned in both is only generated once.
+        """
+        async with case_locks.lock(("discovery", case_id)):
+            # Re-read inside the lock so characters added by a concurrent discovery are indexed
+            case = await case_store.load(case_id, {"characters": 1})
+            if not case:
+                return []
+            
+            index = MentionIndex.from_case(case)
+            discovered = []
+            new_characters = []
+            for mention in mentions:
+                role = mention.get("role")
+                if not role:
+                    continue
+                
+                known_id = index.resolve(mention)
+                if known_id:
+                    # Remember how testimony referred to them so later mentions resolve directly; a role
+                    # or alias the index already has adds nothing, so it is not written (each write is a
+                    # new case version)
+                    alias = normalize_role(role)
+                    if alias and alias not in index.roles:
+                        await case_store.add_alias(case_id, known_id, alias)
+                        index.roles[alias] = known_id
+                    continue
+                
+                new_character = await self.generate_dynamic_character(
+                    case_id,
+                    role,
+                    mention.get("context", ""),
+                    session_id
+                )
+                if not new_character:
+                    continue
+                
+                new_characters.append(new_character.model_dump())
+                index.add(new_characters[-1], role)
+                discovered.append({"character": new_character, "mention": mention})
+            
+            # One batched write for everyone discovered and their persona cards,
+            # stored before the lock is released
+            await asyncio.gather(
+                case_store.add_characters(case_id, new_characters),
+                case_store.set_fields(case_id, persona_card_fields(new_characters)) if new_characters else asyncio.sleep(0)
+            )
+            return discovered
+
     async def analyze_evidence(self, case_id: str, evidence_list: List[str], theory: str, session_id: str) -> str:
         """Analyze evidence and theory using Logic AI"""
-        await self.initialize_logic_ai(session_id)
-        
-        # Get case details from database
-        case = await db.cases.find_one({"id": case_id})
+        return await self.analysis_flights.do(
+            (case_id, tuple(sorted(evidence_list)), " ".join(theory.split()).lower()),
+            lambda: self._analyze_evidence(case_id, evidence_list, theory, session_id)
+        )
+    
+    async def _analyze_evidence(self, case_id: str, evidence_list: List[str], theory: str, session_id: str) -> str:
+        # Compiled case snapshot for this version
+        case = await case_views.get(case_id)
         if not case:
             return "Error: Case not found for analysis."
         
-        # Get full evidence details
-        evidence_details = []
-        for evidence_id in evidence_list:
-            for evidence in case["evidence"]:
-                if evidence["id"] == evidence_id:
-                    evidence_details.append(f"- {evidence['name']}: {evidence['description']} (Found: {evidence['location_found']}, Significance: {evidence['significance']})")
-                    break
+        # "How do these connect?" about evidence the graph already links needs no model call
+        selected = [e.id for e in case.evidence_items(evidence_list)]
+        if is_connection_question(theory, [c.name for c in case.characters]):
+            # Answers are shown as is, so only edges that name no suspect may be used
+            graph = case.evidence_graph.without_people(case.characters_by_id, [c.name for c in case.characters])
+            if graph.connects(selected):
+                self.graph_answers += 1
+                return self._graph_answer(case, graph, selected)
+        
+        # Get full evidence details; both lists are budgeted, ranked by relevance to the theory
+        evidence_details = [
+            f"- {evidence.name}: {evidence.description} (Found: {evidence.location_found}, Significance: {evidence.significance})"
+            for evidence in case.evidence_items(evidence_list)
+        ]
         
-        evidence_text = "\n".join(evidence_details) if evidence_details else "No specific evidence selected"
+        evidence_text = fit_section(
+            evidence_details, section_budget("selected_evidence"), query=theory, separator="\n", max_item_tokens=120
+        ) if evidence_details else "No specific evidence selected"
+        roster = fit_section(
+            [f"{c.name} ({c.description})" for c in case.characters],
+            section_budget("available_characters"), query=f"{theory} {evidence_text}", max_item_tokens=40
+        )
         
-        prompt = f"""Analyze the following detective theory and evidence for the case "{case['title']}":
+        # What suspects said and other records bearing on the theory, instead of whole transcripts
+        passages = await case_search.search(
+            case_id, f"{theory} {evidence_text}", limit=RELATED_PASSAGES, exclude=set(evidence_list)
+        ) or []
+        related_text = fit_section(
+            [f"- [{p['title']}] {p['text']}" for p in passages],
+            section_budget("related_records"), separator="\n", max_item_tokens=120
+        ) or "Nothing else on record matches this theory yet"
+        
+        # Precomputed relationships touching the selection, so they are not re-derived on every call
+        names = {**{e.id: e.name for e in case.evidence}, **{c.id: c.name for c in case.characters}}
+        connections_text = fit_section(
+            [describe_edge(edge, names) for edge in case.evidence_graph.relevant_edges(selected)],
+            section_budget("evidence_connections"), separator="\n"
+        ) or "None precomputed"
+        
+        prompt = f"""Analyze the following detective theory and evidence for the case "{case.title}":
 
 CASE CONTEXT:
-- Victim: {case['victim_name']}
-- Setting: {case['setting']}
-- Crime Scene: {case['crime_scene_description']}
+- Victim: {case.victim_name}
+- Setting: {case.setting}
+- Crime Scene: {case.crime_scene_description}
 
 DETECTIVE'S THEORY:
 {theory}
@@ -663,7 +1031,13 @@ EVIDENCE BEING CONSIDERED:
 {evidence_text}
 
 AVAILABLE CHARACTERS:
-{', '.join([char['name'] + ' (' + char['description'] + ')' for char in case['characters']])}
+{roster}
+
+RELATED TESTIMONY AND RECORDS:
+{related_text}
+
+KNOWN CONNECTIONS (precomputed from the case facts):
+{connections_text}
 
 Provide a logical analysis including:
 1. **Strengths of this theory** - What evidence supports it?
@@ -675,20 +1049,99 @@ Provide a logical analysis including:
 
 Provide a thorough but focused analysis that helps guide the investigation."""
 
-        response = await self.logic_ai.send_message(UserMessage(text=prompt))
+        response = await self._ask("evidence_analysis", session_id, prompt)
+        model_router.record_quality("evidence_analysis", bool(response.strip()))
         return response
 
-    async def _generate_crime_scene_background(self, case_id: str):
-        """Generate crime scene image in background without blocking case creation"""
+    def _graph_answer(self, case, graph: EvidenceGraph, selected: List[str]) -> str:
+        """Answer a connection question about the selected evidence from evidence-only graph edges"""
+        names = {e.id: e.name for e in case.evidence}
+        selected_set = set(selected)
+        edges = graph.relevant_edges(selected)
+        among = [describe_edge(e, names) for e in edges if e["source"] in selected_set and e["target"] in selected_set]
+        others = [describe_edge(e, names) for e in edges
+                  if not (e["source"] in selected_set and e["target"] in selected_set)]
+        sections = []
+        if among:
+            sections.append("**How the selected evidence connects**\n" + "\n".join(among))
+        if others:
+            sections.append("**Other evidence it connects to**\n" + "\n".join(others))
+        return "\n\n".join(sections)
+
+    async def run_evidence_graph_job(self, job: Job):
+        """Background job handler: relate the case's evidence and characters in one Logic AI pass"""
+        case_id = job.payload["case_id"]
+        case = await case_views.get(case_id)
+        if not case or case.evidence_graph:
+            return
+        response = await self._ask("evidence_graph", str(uuid.uuid4()), build_evidence_graph_prompt(case))
+        # A parse error raises, leaving the job pending for a retry
         try:
-            print(f"Starting background crime scene generation for case {case_id}")
-            crime_scene_url = await self.generate_crime_scene_image(case_id)
-            if crime_scene_url:
-                print(f"Crime scene image generated successfully: {crime_scene_url}")
-            else:
-                print(f"Failed to generate crime scene image for case {case_id}")
-        except Exception as e:
-            print(f"Error in background crime scene generation: {e}")
+            graph = parse_evidence_graph(response, case)
+        except Exception:
+            model_router.record_quality("evidence_graph", False)
+            raise
+        model_router.record_quality("evidence_graph", bool(graph["edges"]))
+        await case_store.set_fields(case_id, {"evidence_graph": graph})
+        print(f"Evidence graph ready for case {case_id}: {len(graph['edges'])} edges")
+
+    async def run_timeline_job(self, job: Job):
+        """Background job handler: merge testimony and people added since the last update into the timeline"""
+        case_id = job.payload["case_id"]
+        case = await case_views.get(case_id)
+        if not case:
+            return
+        stored = await case_timelines.get(case_id)
+        testimony = await case_timelines.new_testimony(case_id, stored)
+        known = set((stored or {}).get("character_ids") or [])
+        new_characters = [c for c in case.characters if c.id not in known]
+        if stored and not testimony and not new_characters:
+            return
+        
+        response = await self._ask("timeline", str(uuid.uuid4()),
+                                   build_timeline_prompt(case, stored, testimony, new_characters))
+        # A parse error or a lost save race raises, leaving the job pending for a retry
+        try:
+            timeline = parse_timeline(response)
+        except Exception:
+            model_router.record_quality("timeline", False)
+            raise
+        model_router.record_quality("timeline", bool(timeline["events"]))
+        await case_timelines.save(case_id, stored, timeline, testimony, [c.id for c in case.characters])
+        print(f"Timeline updated for case {case_id}: {len(testimony)} new statements, {len(timeline['events'])} events")
+
+    async def run_canned_answers_job(self, job: Job):
+        """Background job handler: pre-generate every suspect's answers to the common questions"""
+        case_id = job.payload["case_id"]
+        case = await case_views.get(case_id)
+        if not case:
+            return
+        cards = {c.id: case.persona_cards.get(c.id) or compile_persona(c.to_dict()) for c in case.characters}
+        context = case.persona_context or compile_case_context(
+            {"title": case.title, "victim_name": case.victim_name, "setting": case.setting,
+             "crime_scene_description": case.crime_scene_description}
+        )
+        
+        response = await self._ask("canned_answers", str(uuid.uuid4()), build_canned_answers_prompt(context, cards))
+        # A parse error raises, leaving the job pending for a retry
+        try:
+            answers = parse_canned_answers(response, list(cards))
+        except Exception:
+            model_router.record_quality("canned_answers", False)
+            raise
+        model_router.record_quality("canned_answers", bool(answers))
+        await case_store.set_fields(case_id, {f"canned_answers.{cid}": a for cid, a in answers.items()})
+        print(f"Canned answers ready for case {case_id}: {sum(len(a) for a in answers.values())} answers")
+    
+    async def run_crime_scene_job(self, job: Job):
+        """Background job handler: generate the crime scene image without blocking case creation"""
+        case_id = job.payload["case_id"]
+        print(f"Starting background crime scene generation for case {case_id}")
+        crime_scene_url = await self.generate_crime_scene_image(case_id, job)
+        if not crime_scene_url:
+            # Raising leaves the job pending so it is retried
+            raise RuntimeError(f"Failed to generate crime scene image for case {case_id}")
+        print(f"Crime scene image generated successfully: {crime_scene_url}")
 
 # Initialize AI service
 ai_service = DualAIDetectiveService()
@@ -697,71 +1150,140 @@ ai_service = DualAIDetectiveService()
 async def root():
     return {"message": "Dual-AI Detective Game API", "status": "active"}
 
+async def idempotent(scope: str, key: Optional[str], fingerprint: str, compute):
+    """Run an expensive POST at most once per Idempotency-Key (see idempotency.py)"""
+    try:
+        return await idempotency.run(scope, key, fingerprint, compute)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
 @app.post("/api/generate-case")
-async def generate_case():
-    """Generate a new mystery case"""
+async def generate_case(mode: str = "ai", idempotency_key: Optional[str] = Header(None)):
+    """Generate a new mystery case. Retries with the same Idempotency-Key get the same case.
+
+    `mode=instant` builds the case procedurally, without waiting for the Storyteller AI.
+    """
+    if mode not in ("ai", "instant"):
+        raise HTTPException(status_code=400, detail="mode must be 'ai' or 'instant'")
+    return await idempotent("generate-case", idempotency_key, request_fingerprint(mode),
+                            lambda: _generate_case(mode))
+
+async def _generate_case(mode: str = "ai"):
     try:
         session_id = str(uuid.uuid4())
-        case = await ai_service.generate_mystery_case(session_id)
-        
-        # Store in database
-        await db.cases.insert_one(case.model_dump())
+        # Both paths store the case themselves
+        if mode == "instant":
+            case = await ai_service.generate_procedural_case()
+        else:
+            case = await ai_service.generate_mystery_case(session_id)
         
-        # Return case without solution
-        case_response = case.model_copy()
-        case_response.solution = "Hidden until case is solved"
+        # Return case without solution or culprit flags
+        case_response = case.model_dump(exclude={"solution": True, "characters": {"__all__": {"is_culprit"}}})
+        case_response["solution"] = HIDDEN_SOLUTION
         
-        return {"case": case_response, "session_id": session_id}
+        return raw_json_response(dumps({"case": case_response, "session_id": session_id}))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate case: {str(e)}")
 
-@app.get("/api/cases/{case_id}")
-async def get_case(case_id: str):
-    """Get a specific case"""
+@app.get("/api/cases/{case_id}", response_model=CaseResponse, response_model_exclude_unset=True)
+async def get_case(case_id: str, fields: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    """Get a specific case with scene/character counts and the most recent page of each.
+
+    `fields` selects a subset of case fields (e.g. `fields=title,setting,crime_scene_image_url`).
+    Responses carry an ETag derived from the case version; a matching If-None-Match gets a 304.
+    Payloads are validated against CaseResponse when built, then served pre-serialized.
+    """
     try:
-        case = await db.cases.find_one({"id": case_id})
+        try:
+            selected = parse_fields(fields)
+        except InvalidFieldSet as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # Unchanged versions are served from the pre-serialized payload
+        version = await case_store.get_version(case_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Case not found")
+        
+        etag = version_etag(case_id, version, selected)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        body = case_payloads.get(case_id, version, selected)
+        if body is not None:
+            return raw_json_response(body, headers=cache_headers(etag))
+        
+        # _id, solution and culprit flags are excluded by the projection itself
+        projection = case_projection(selected)
+        case = await case_store.get(case_id, {**projection, "visual_scenes": 1} if selected else projection)
         if not case:
             raise HTTPException(status_code=404, detail="Case not found")
         
-        # Remove MongoDB ObjectId and solution from response
-        if "_id" in case:
-            del case["_id"]
-        
-        # Convert any ObjectId to string to ensure JSON serialization
-        def convert_objectid(obj):
-            from bson import ObjectId
-            if isinstance(obj, dict):
-                return {k: convert_objectid(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_objectid(item) for item in obj]
-            elif isinstance(obj, ObjectId):
-                return str(obj)
-            else:
-                return obj
+        # Cases created before scenes moved to their own collection
+        if case.get("visual_scenes"):
+            await case_store.migrate_embedded_scenes({**case, "id": case_id})
+            case = await case_store.get(case_id, projection)
+        case.pop("visual_scenes", None)
         
-        case = convert_objectid(case)
-        case["solution"] = "Hidden until case is solved"
+        if selected is None or "visual_scenes" in selected:
+            scenes = await case_store.scene_page(case_id)
+            case["visual_scenes"] = scenes["items"]
+            case["next_scene_cursor"] = scenes["next_cursor"]
+        if selected is None or "characters" in selected:
+            discovered = await case_store.character_page(case_id)
+            case["characters"] = case.get("characters", []) + discovered["items"]
+            case["next_character_cursor"] = discovered["next_cursor"]
+        if selected is None:
+            case["solution"] = HIDDEN_SOLUTION
         
-        return {"case": case}
+        # Validated and trimmed to the declared schema once per version, not on every cached read
+        payload = CaseResponse.model_validate({"case": case})
+        body = dumps(payload.model_dump(exclude_unset=True))
+        built_version = payload.case.version
+        case_payloads.put(case_id, built_version, body, selected)
+        return raw_json_response(body, headers=cache_headers(version_etag(case_id, built_version, selected)))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve case: {str(e)}")
 
+@app.get("/api/cases/{case_id}/changes")
+async def get_case_changes(case_id: str, since: int = 0):
+    """Get the characters, scenes and field updates added to a case after a version"""
+    try:
+        version = await case_store.get_version(case_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Case not found")
+        
+        if version <= since:
+            return Response(status_code=304)
+        
+        delta = await case_store.changes_since(case_id, since)
+        if delta["version"] == since:
+            # Newer versions are still being written to the log
+            return Response(status_code=304)
+        
+        return delta
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get case changes: {str(e)}")
+
 @app.post("/api/question-character")
-async def question_character(request: QuestionRequest):
-    """Question a character in the case"""
+async def question_character(request: QuestionRequest, idempotency_key: Optional[str] = Header(None)):
+    """Question a character in the case. Retries with the same Idempotency-Key get the same answer."""
+    return await idempotent(
+        "question-character", idempotency_key, request_fingerprint(request.model_dump()),
+        lambda: _question_character(request)
+    )
+
+async def _question_character(request: QuestionRequest):
     try:
         # Get case data
-        case = await db.cases.find_one({"id": request.case_id})
+        case = await case_views.get(request.case_id)
         if not case:
             raise HTTPException(status_code=404, detail="Case not found")
         
-        # Find character
-        character = None
-        for char in case["characters"]:
-            if char["id"] == request.character_id:
-                character = char
-                break
-        
+        character = case.character(request.character_id)
         if not character:
             raise HTTPException(status_code=404, detail="Character not found")
         
@@ -769,7 +1291,7 @@ async def question_character(request: QuestionRequest):
         session_id = str(uuid.uuid4())
         result = await ai_service.question_character(
             request.case_id, 
-            character["name"], 
+            character.name, 
             request.question,
             session_id
         )
@@ -777,36 +1299,37 @@ async def question_character(request: QuestionRequest):
         if "error" in result:
             raise HTTPException(status_code=500, detail=result["error"])
         
+        # Kept for search and for evidence analysis; the answer is returned even if this fails
+        try:
+            await case_search.record_testimony(
+                request.case_id, character.id, character.name, request.question, result["response"]
+            )
+        except Exception as e:
+            print(f"Error recording testimony: {e}")
+        
         response_data = {
-            "character_name": character["name"], 
+            "character_name": character.name, 
             "response": result["response"],
             "new_characters_discovered": [],
             "visual_scene_generated": None
         }
         
-        # Process any new character mentions
+        # Process any new character mentions (already-known people are dropped)
         if result["new_character_mentions"]:
-            for mention in result["new_character_mentions"]:
-                # Generate the new character
-                new_character = await ai_service.generate_dynamic_character(
-                    request.case_id,
-                    mention["role"],
-                    mention["context"],
-                    session_id
-                )
-                
-                if new_character:
-                    # Add to case in database
-                    await db.cases.update_one(
-                        {"id": request.case_id},
-                        {"$push": {"characters": new_character.model_dump()}}
-                    )
-                    
-                    response_data["new_characters_discovered"].append({
-                        "character": new_character.model_dump(),
-                        "discovered_through": character["name"],
-                        "context": mention["context"]
-                    })
+            discoveries = await ai_service.discover_characters(
+                request.case_id,
+                result["new_character_mentions"],
+                session_id
+            )
+            for discovery in discoveries:
+                response_data["new_characters_discovered"].append({
+                    "character": discovery["character"].model_dump(),
+                    "discovered_through": character.name,
+                    "context": discovery["mention"].get("context", "")
+                })
+        
+        # New testimony and people go into the case timeline once questioning pauses
+        timeline_scheduler.touch(request.case_id)
         
         # Check if response contains visual descriptions that could be turned into scenes
         response_text = result["response"].lower()
@@ -817,9 +1340,9 @@ async def question_character(request: QuestionRequest):
                 # Generate visual scene from testimony
                 visual_scene = await ai_service.generate_visual_scene(
                     request.case_id,
-                    f"{character['name']} testified: {result['response']}",
+                    f"{character.name} testified: {result['response']}",
                     "testimony",
-                    character["name"]
+                    character.name
                 )
                 
                 if visual_scene:
@@ -838,24 +1361,39 @@ async def generate_dynamic_character_endpoint(case_id: str, role: str, context:
     """Generate a new character based on a mention"""
     try:
         session_id = str(uuid.uuid4())
-        character = await ai_service.generate_dynamic_character(case_id, role, context, session_id)
+        discoveries = await ai_service.discover_characters(
+            case_id,
+            [{"role": role, "context": context}],
+            session_id
+        )
         
-        if character:
-            # Add to case in database
-            await db.cases.update_one(
-                {"id": case_id},
-                {"$push": {"characters": character.model_dump()}}
-            )
-            return {"character": character.model_dump()}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to generate character")
+        if discoveries:
+            return {"character": discoveries[0]["character"].model_dump()}
+        
+        # The mention may resolve to someone already in the case
+        case = await case_store.load(case_id, {"characters": 1})
+        known_id = MentionIndex.from_case(case).resolve({"role": role}) if case else None
+        if known_id:
+            view = await case_views.get(case_id)
+            character = view.character(known_id) if view else None
+            if character:
+                return {"character": character.to_dict(exclude=("is_culprit",)), "already_known": True}
+        
+        raise HTTPException(status_code=500, detail="Failed to generate character")
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate dynamic character: {str(e)}")
 
 @app.post("/api/generate-visual-scene")
-async def generate_visual_scene_endpoint(case_id: str, scene_context: str, scene_type: str = "manual"):
-    """Generate a visual scene for a specific context"""
+async def generate_visual_scene_endpoint(case_id: str, scene_context: str, scene_type: str = "manual",
+                                         idempotency_key: Optional[str] = Header(None)):
+    """Generate a visual scene for a specific context. Retries with the same Idempotency-Key get the same scene."""
+    return await idempotent(
+        "generate-visual-scene", idempotency_key, request_fingerprint(case_id, scene_context, scene_type),
+        lambda: _generate_visual_scene(case_id, scene_context, scene_type)
+    )
+
+async def _generate_visual_scene(case_id: str, scene_context: str, scene_type: str):
     try:
         session_id = str(uuid.uuid4())
         scene = await ai_service.generate_visual_scene(case_id, scene_context, scene_type)
@@ -869,19 +1407,93 @@ async def generate_visual_scene_endpoint(case_id: str, scene_context: str, scene
         raise HTTPException(status_code=500, detail=f"Failed to generate visual scene: {str(e)}")
 
 @app.get("/api/case-scenes/{case_id}")
-async def get_case_scenes(case_id: str):
-    """Get all visual scenes for a case"""
+async def get_case_scenes(case_id: str, cursor: Optional[str] = None, limit: int = 20,
+                          if_none_match: Optional[str] = Header(None)):
+    """Get a page of visual scenes for a case, newest page first"""
     try:
-        case = await db.cases.find_one({"id": case_id})
+        case = await case_store.get(case_id, {"_id": 0, "id": 1, "visual_scenes": 1, "visual_scene_count": 1,
+                                              "version": 1})
         if not case:
             raise HTTPException(status_code=404, detail="Case not found")
         
-        scenes = case.get("visual_scenes", [])
-        return {"scenes": scenes}
+        if case.get("visual_scenes"):
+            await case_store.migrate_embedded_scenes(case)
+            case = await case_store.get(case_id, {"_id": 0, "visual_scene_count": 1, "version": 1})
         
+        etag = version_etag(case_id, case.get("version", 0), ("scenes", cursor, limit))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        page = await case_store.scene_page(case_id, cursor, limit)
+        body = dumps({
+            "scenes": page["items"],
+            "next_cursor": page["next_cursor"],
+            "total": case.get("visual_scene_count", 0)
+        })
+        return raw_json_response(body, headers=cache_headers(etag))
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get case scenes: {str(e)}")
 
+@app.get("/api/cases/{case_id}/search")
+async def search_case(case_id: str, q: str, limit: int = 10):
+    """Testimony, evidence and character profiles most relevant to a query (BM25)"""
+    try:
+        results = await case_search.search(case_id, q, max(1, min(limit, 50)))
+        if results is None:
+            raise HTTPException(status_code=404, detail="Case not found")
+        return {"query": q, "results": results}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search case: {str(e)}")
+
+@app.get("/api/cases/{case_id}/timeline")
+async def get_case_timeline(case_id: str):
+    """The stored investigation timeline and summary; updated in the background, never generated here"""
+    try:
+        timeline = await case_timelines.get(case_id)
+        if timeline is None:
+            if await case_store.get_version(case_id) is None:
+                raise HTTPException(status_code=404, detail="Case not found")
+            return {"case_id": case_id, "status": "pending", "summary": None, "events": [], "updated_at": None}
+        return {
+            "case_id": case_id,
+            "status": "ready",
+            "summary": timeline["summary"],
+            "events": timeline["events"],
+            "testimony_count": timeline.get("testimony_count", 0),
+            "updated_at": timeline["updated_at"],
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get case timeline: {str(e)}")
+
+@app.get("/api/cases/{case_id}/characters")
+async def get_discovered_characters(case_id: str, cursor: Optional[str] = None, limit: int = 20):
+    """Get a page of dynamically discovered characters for a case, newest page first"""
+    try:
+        case = await case_store.get(case_id, {"_id": 0, "discovered_character_count": 1})
+        if not case:
+            raise HTTPException(status_code=404, detail="Case not found")
+        
+        page = await case_store.character_page(case_id, cursor, limit)
+        return {
+            "characters": page["items"],
+            "next_cursor": page["next_cursor"],
+            "total": case.get("discovered_character_count", 0)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get discovered characters: {str(e)}")
+
 @app.post("/api/analyze-evidence")
 async def analyze_evidence(request: AnalysisRequest):
     """Analyze evidence and theory using Logic AI"""
@@ -902,6 +1514,69 @@ async def analyze_evidence(request: AnalysisRequest):
 async def health_check():
     return {"status": "healthy", "ai_services": "dual-ai-active"}
 
+@app.get("/api/metrics")
+async def metrics():
+    """Per-worker cache, coalescing and background job counters"""
+    return {
+        "pid": os.getpid(),
+        "singleflight": singleflight_stats(),
+        "case_payload_cache": {"entries": len(case_payloads), "hits": case_payloads.hits, "misses": case_payloads.misses},
+        "case_writes": {"batched": case_store.batched_writes, "flushes": case_store.batch_flushes} if case_store else {},
+        "case_views": case_views.stats() if case_views else {},
+        "case_search": case_search.stats() if case_search else {},
+        "persona_prompts": ai_service.persona_stats.stats(),
+        "canned_answers": {"hits": ai_service.canned_hits, "live": ai_service.live_answers},
+        "evidence_graph_answers": ai_service.graph_answers,
+        "procedural_cases": ai_service.procedural_cases,
+        "timeline_updates": timeline_scheduler.stats(),
+        "logic_batching": {route: batcher.stats() for route, batcher in ai_service.classifiers.items()},
+        "model_routes": model_router.stats(),
+        "idempotency_replays": idempotency.replays if idempotency else 0,
+        "background_jobs_running": len(job_runner) if job_runner else 0,
+    }
+
+@app.get("/api/model-routes")
+async def get_model_routes():
+    """Current model profile for each AI call type"""
+    return {"routes": model_router.table()}
+
+@app.put("/api/model-routes/{route}")
+async def set_model_route(route: str, profile: Optional[ModelProfile] = None, x_admin_token: Optional[str] = Header(None)):
+    """Switch the model a call type uses on every worker; an empty body restores the default"""
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+    try:
+        await model_router.set_profile(route, profile)
+    except UnknownRoute:
+        raise HTTPException(status_code=404, detail="Unknown model route")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to update model route: {str(e)}")
+    return {"route": route, **model_router.table()[route]}
+
+@app.get("/api/ready")
+async def readiness_check():
+    """Readiness probe: MongoDB answers a ping and every provider the model routes use has a key.
+
+    Image generation is optional; without FAL_KEY the service is ready but reported degraded.
+    """
+    provider_keys = {"openai": OPENAI_API_KEY, "anthropic": ANTHROPIC_API_KEY}
+    providers = sorted({model_router.profile(route).provider for route in model_router.defaults})
+    checks = {"mongodb": False, **{f"{provider}_key": bool(provider_keys[provider]) for provider in providers}}
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=2)
+        checks["mongodb"] = True
+    except Exception as e:
+        print(f"Readiness check: MongoDB ping failed: {e}")
+    
+    ready = all(checks.values())
+    degraded = [] if FAL_KEY else ["image_generation"]
+    return FastJSONResponse(
+        {"status": ("degraded" if degraded else "ready") if ready else "not_ready", "checks": checks,
+         "degraded": degraded},
+        status_code=200 if ready else 503
+    )
+
 if __name__ == "__main__":
+    # Single-process development server; production uses serve.py
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001, loop="auto", http="auto")
\ No newline at end of file
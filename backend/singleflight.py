@@ -0,0 +1,70 @@
+"""
+Single Flight
+
+Coalesces identical concurrent operations: while a call for a key is in
+flight, later callers with the same key await that call instead of starting
+their own. Used for case reads, visual scene generation and evidence analysis,
+which several tabs or players often trigger for the same case at once.
+
+The shared call runs as its own task, so a caller that disconnects does not
+cancel it for the others. Every group counts how many calls it coalesced;
+`singleflight_stats()` reports them for the metrics endpoint.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_groups: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """A named group of in-flight calls keyed by what they compute"""
+
+    def __init__(self, name: str, clone: Optional[Callable[[Any], Any]] = None):
+        # `clone` gives every caller, the one that started the call included, its own copy of the
+        # result, for callers that mutate what they get back
+        self.name = name
+        self.clone = clone
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+        _groups[name] = self
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+            return self._result(await asyncio.shield(task))
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._release(key, task))
+        return self._result(await asyncio.shield(task))
+
+    def _result(self, result: Any) -> Any:
+        # The task's result stays pristine; nobody holds it directly
+        return self.clone(result) if self.clone else result
+
+    def _release(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here so a failure nobody awaited is not logged as unhandled
+
+    def forget(self, match: Callable[[Hashable], bool]):
+        """Stop sharing in-flight calls whose key matches, e.g. reads started before a write"""
+        for key in [k for k in self._inflight if match(k)]:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "coalescing_rate": round(self.shared / self.calls, 4) if self.calls else 0.0,
+            "in_flight": len(self._inflight),
+        }
+
+
+def singleflight_stats() -> dict:
+    return {name: group.stats() for name, group in _groups.items()}
@@ -4,26 +4,58 @@ set -e
 # Start the FastAPI backend
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
-echo "Starting FastAPI backend"
-# Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+# One worker per CPU unless WEB_CONCURRENCY is set
+WORKERS=${WEB_CONCURRENCY:-$(nproc)}
+BASE_PORT=${BACKEND_BASE_PORT:-8001}
+READY_TIMEOUT=${READY_TIMEOUT:-120}
+export WEB_CONCURRENCY=$WORKERS BACKEND_BASE_PORT=$BASE_PORT
+export NGINX_UPSTREAM_FILE=/etc/nginx/backend_servers.conf
+export EDGE_CACHE_URL=${EDGE_CACHE_URL:-http://127.0.0.1:8080}
+
+echo "Starting FastAPI backend ($WORKERS workers)"
+python3 serve.py &
 BACKEND_PID=$!
 
-echo "Waiting for backend to start..."
-sleep 30
+# Handle termination signals: let the workers drain before exiting. Installed before the
+# readiness wait so a stop during startup still shuts the workers down cleanly.
+NGINX_PID=
+shutdown() {
+    [ -n "$NGINX_PID" ] && kill -QUIT $NGINX_PID 2>/dev/null || true  # graceful: finish in-flight requests
+    kill -TERM $BACKEND_PID 2>/dev/null || true
+    wait $BACKEND_PID 2>/dev/null || true
+    exit 0
+}
+trap shutdown TERM INT
 
-if ! kill -0 $BACKEND_PID 2>/dev/null; then
-    echo "Backend failed to start at initialization, exiting"
-    exit 1
-fi
+# Wait until every worker reports ready (MongoDB reachable, model provider keys configured)
+echo "Waiting for backend workers to become ready..."
+elapsed=0
+port=$BASE_PORT
+last_port=$((BASE_PORT + WORKERS - 1))
+while [ "$port" -le "$last_port" ]; do
+    if ! kill -0 $BACKEND_PID 2>/dev/null; then
+        echo "Backend failed to start at initialization, exiting"
+        exit 1
+    fi
+    if wget -q -O /dev/null "http://127.0.0.1:$port/api/ready" 2>/dev/null; then
+        echo "Worker on port $port is ready"
+        port=$((port + 1))
+        continue
+    fi
+    if [ "$elapsed" -ge "$READY_TIMEOUT" ]; then
+        echo "Backend not ready after ${READY_TIMEOUT}s, exiting"
+        wget -q -O - "http://127.0.0.1:$port/api/ready" 2>&1 || true
+        kill $BACKEND_PID
+        exit 1
+    fi
+    sleep 1
+    elapsed=$((elapsed + 1))
+done
 
 # Start Nginx
 nginx -g 'daemon off;' &
 NGINX_PID=$!
 
-# Handle termination signals
-trap 'kill $BACKEND_PID $NGINX_PID; exit 0' SIGTERM SIGINT
-
 # Check if processes are still running
 while kill -0 $BACKEND_PID 2>/dev/null && kill -0 $NGINX_PID 2>/dev/null; do
     sleep 1
@@ -13,17 +13,38 @@
  * License: Proprietary
  */
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './App.css';
 
 // Backend URL from environment variables
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 
+// POST with an Idempotency-Key. A network failure or gateway error is retried once
+// with the same key, so the backend still generates the case/answer only once.
+const postIdempotent = async (url, options = {}) => {
+  const key = window.crypto?.randomUUID
+    ? window.crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+  const send = () => fetch(url, {
+    ...options,
+    method: 'POST',
+    headers: { ...(options.headers || {}), 'Idempotency-Key': key },
+  });
+  try {
+    const response = await send();
+    if (![502, 503, 504].includes(response.status)) return response;
+  } catch (error) {
+    console.warn('Request failed, retrying with the same Idempotency-Key:', error);
+  }
+  return send();
+};
+
 function App() {
   // Core game state
   const [currentCase, setCurrentCase] = useState(null);
   const [sessionId, setSessionId] = useState(null);
   const [loading, setLoading] = useState(false);
+  const caseEtagRef = useRef(null); // ETag of the last full case fetch
   
   // Investigation state
   const [activeCharacter, setActiveCharacter] = useState(null);
@@ -124,42 +145,97 @@ function App() {
     }
   };
 
+  // Merge a change-log delta into the case: characters we already have are replaced by their
+  // newer copy (e.g. a new alias), scenes we already added locally are skipped
+  const mergeCaseDelta = (prevCase, delta) => {
+    // One entry per id; when a character is listed twice the later copy wins
+    const changedCharacters = new Map(delta.characters.map(char => [char.id, char]));
+    const knownCharacterIds = new Set(prevCase.characters.map(char => char.id));
+    const knownSceneIds = new Set((prevCase.visual_scenes || []).map(scene => scene.id));
+    
+    return {
+      ...prevCase,
+      ...delta.updates,
+      characters: [
+        ...prevCase.characters.map(char => ({ ...char, ...(changedCharacters.get(char.id) || {}) })),
+        ...[...changedCharacters.values()].filter(char => !knownCharacterIds.has(char.id))
+      ],
+      visual_scenes: [
+        ...(prevCase.visual_scenes || []),
+        ...delta.visual_scenes.filter(scene => !knownSceneIds.has(scene.id))
+      ],
+      version: delta.version
+    };
+  };
+
+  // Re-download the full case when the change log cannot be applied
+  const fetchFullCase = async () => {
+    const headers = {
+      'Content-Type': 'application/json',
+    };
+    // Send back the validator so an unchanged case costs a 304 instead of the full payload
+    if (caseEtagRef.current?.caseId === currentCase.id) {
+      headers['If-None-Match'] = caseEtagRef.current.etag;
+    }
+    
+    const response = await fetch(`${BACKEND_URL}/api/cases/${currentCase.id}`, {
+      method: 'GET',
+      headers,
+    });
+    
+    if (response.status === 304) return;
+    
+    if (response.ok) {
+      const etag = response.headers.get('ETag');
+      if (etag) {
+        caseEtagRef.current = { caseId: currentCase.id, etag };
+      }
+      
+      const data = await response.json();
+      const updatedCase = data.case;
+      
+      // The case only carries the most recent page of scenes and discovered characters
+      setCurrentCase(prev => mergeCaseDelta(prev, {
+        updates: { crime_scene_image_url: updatedCase.crime_scene_image_url },
+        characters: updatedCase.characters,
+        visual_scenes: updatedCase.visual_scenes || [],
+        version: updatedCase.version
+      }));
+    }
+  };
+
   // Function to refresh case data and check for new images
   const refreshCaseData = async () => {
     if (!currentCase?.id) return;
     
     try {
-      const response = await fetch(`${BACKEND_URL}/api/cases/${currentCase.id}`, {
+      // Only fetch what changed since the version we hold
+      const since = currentCase.version || 0;
+      const response = await fetch(`${BACKEND_URL}/api/cases/${currentCase.id}/changes?since=${since}`, {
         method: 'GET',
         headers: {
           'Content-Type': 'application/json',
         },
       });
       
+      if (response.status === 304) return;
+      
       if (response.ok) {
-        const data = await response.json();
-        const updatedCase = data.case;
+        const delta = await response.json();
         
-        // Check if crime scene image was added
-        if (!currentCase.crime_scene_image_url && updatedCase.crime_scene_image_url) {
-          console.log('Crime scene image now available:', updatedCase.crime_scene_image_url);
-          setCurrentCase(prev => ({
-            ...prev,
-            crime_scene_image_url: updatedCase.crime_scene_image_url
-          }));
+        if (delta.resync) {
+          await fetchFullCase();
+          return;
         }
         
-        // Check if new visual scenes were added
-        const currentScenesCount = (currentCase.visual_scenes || []).length;
-        const updatedScenesCount = (updatedCase.visual_scenes || []).length;
-        
-        if (updatedScenesCount > currentScenesCount) {
-          console.log('New visual scenes detected:', updatedScenesCount - currentScenesCount);
-          setCurrentCase(prev => ({
-            ...prev,
-            visual_scenes: updatedCase.visual_scenes || []
-          }));
+        if (delta.updates.crime_scene_image_url) {
+          console.log('Crime scene image now available:', delta.updates.crime_scene_image_url);
+        }
+        if (delta.visual_scenes.length > 0) {
+          console.log('New visual scenes detected:', delta.visual_scenes.length);
         }
+        
+        setCurrentCase(prev => mergeCaseDelta(prev, delta));
       }
     } catch (error) {
       console.error('Error refreshing case data:', error);
@@ -208,8 +284,7 @@ function App() {
     try {
       console.log('Making API call to:', `${BACKEND_URL}/api/generate-case`);
       
-      const response = await fetch(`${BACKEND_URL}/api/generate-case`, {
-        method: 'POST',
+      const response = await postIdempotent(`${BACKEND_URL}/api/generate-case`, {
         headers: {
           'Content-Type': 'application/json',
         },
@@ -257,10 +332,10 @@ function App() {
     
     setLoading(true);
     try {
-      const response = await fetch(`${BACKEND_URL}/api/question-character`, {
-        method: 'POST',
+      const response = await postIdempotent(`${BACKEND_URL}/api/question-character`, {
         headers: {
           'Content-Type': 'application/json',
+          'X-Case-Id': currentCase.id, // lets the proxy route to the worker that owns this case
         },
         body: JSON.stringify({
           case_id: currentCase.id,
@@ -376,6 +451,7 @@ function App() {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'X-Case-Id': currentCase.id, // lets the proxy route to the worker that owns this case
         },
         body: JSON.stringify({
           case_id: currentCase.id,
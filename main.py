@@ -5,7 +5,9 @@ Dual-AI Detective Game - Main Entry Point
 This is the main entry point for the Dual-AI Detective Game backend.
 The actual FastAPI server is located in backend/server.py
 
-This file provides a unified entry point for the application.
+This file provides a unified entry point for the application. By default it
+starts the production serving profile (backend/serve.py); pass --dev for a
+single development process.
 """
 
 import sys
@@ -15,13 +17,17 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
 
 if __name__ == "__main__":
-    # Import and run the FastAPI server
-    from backend.server import app
-    import uvicorn
-    
     print("🕵️ Starting Dual-AI Detective Game Backend...")
     print("🤖 Dual-AI System: OpenAI GPT-4 + Anthropic Claude")
     print("🎨 Visual Generation: FAL.AI")
     print("🌐 Server: FastAPI")
     
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
\ No newline at end of file
+    if "--dev" in sys.argv:
+        # Single process with auto-reload friendly defaults
+        import uvicorn
+        uvicorn.run("server:app", host="0.0.0.0", port=8001, log_level="info",
+                    app_dir=os.path.join(os.path.dirname(__file__), 'backend'))
+    else:
+        # Supervised multi-worker pool with uvloop + httptools
+        from serve import main
+        main()
\ No newline at end of file
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+nginx Throughput Benchmark
+
+Starts local stand-ins for the uvicorn backend pool (ports 8001..800N) that
+answer case reads after a simulated processing delay, then drives GET load
+through nginx and reports throughput, latency percentiles, micro-cache hit
+rates and whether consistent hashing kept every case on a single backend.
+
+Usage:
+    nginx -c /path/to/nginx.conf          # in another shell, config from this repo
+    python scripts/bench_nginx.py                     # load through nginx on :8080
+    python scripts/bench_nginx.py --direct            # baseline: one stand-in, no nginx
+
+Only the standard library is used so it runs anywhere nginx does.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+
+
+async def start_standin(port: int, delay: float, hits: Counter):
+    """Minimal HTTP/1.1 keep-alive server imitating GET /api/cases/{id}"""
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                path = request_line.decode().split(" ")[1]
+                while (await reader.readline()) not in (b"\r\n", b""):
+                    pass
+
+                hits[port] += 1
+                await asyncio.sleep(delay)
+                case_id = path.rstrip("/").split("/")[-1].split("?")[0]
+                body = json.dumps({"case": {"id": case_id, "served_by": port, "padding": "x" * 2048}}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    + f'ETag: "{case_id}:0"\r\n'.encode()
+                    + b"Cache-Control: no-cache\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (ConnectionResetError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", port)
+
+
+async def fetch(reader, writer, host: str, path: str):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers, body
+
+
+async def run_load(target: str, total: int, concurrency: int, case_ids):
+    url = urlparse(target)
+    latencies = []
+    cache_status = Counter()
+    served_by = defaultdict(set)
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        for _ in remaining:
+            case_id = random.choice(case_ids)
+            started = time.perf_counter()
+            try:
+                status, headers, body = await fetch(reader, writer, url.netloc, f"/api/cases/{case_id}")
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors += 1
+                reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+                continue
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+                continue
+            cache_status[headers.get("x-cache-status", "NONE")] += 1
+            served_by[case_id].add(json.loads(body)["case"]["served_by"])
+        writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return elapsed, latencies, cache_status, served_by, errors
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:8080", help="nginx address")
+    parser.add_argument("--direct", action="store_true", help="bypass nginx and hit the first stand-in")
+    parser.add_argument("--upstreams", type=int, default=4)
+    parser.add_argument("--base-port", type=int, default=8001)
+    parser.add_argument("--delay-ms", type=float, default=20.0, help="simulated backend time per request")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--cases", type=int, default=50, help="distinct case ids in the workload")
+    args = parser.parse_args()
+
+    hits = Counter()
+    servers = [await start_standin(args.base_port + i, args.delay_ms / 1000, hits) for i in range(args.upstreams)]
+    target = f"http://127.0.0.1:{args.base_port}" if args.direct else args.target
+    case_ids = [str(uuid.uuid4()) for _ in range(args.cases)]
+
+    print(f"Benchmarking {target} - {args.requests} requests, concurrency {args.concurrency}, "
+          f"{args.cases} cases, {args.delay_ms:.0f}ms simulated backend time")
+    elapsed, latencies, cache_status, served_by, errors = await run_load(
+        target, args.requests, args.concurrency, case_ids
+    )
+
+    for server in servers:
+        server.close()
+
+    print(f"Throughput:     {len(latencies) / elapsed:,.0f} req/s ({errors} errors)")
+    if latencies:
+        print(f"Latency:        p50 {percentile(latencies, 50) * 1000:.1f}ms  "
+              f"p95 {percentile(latencies, 95) * 1000:.1f}ms  "
+              f"p99 {percentile(latencies, 99) * 1000:.1f}ms  "
+              f"mean {statistics.mean(latencies) * 1000:.1f}ms")
+    print(f"Cache status:   {dict(cache_status)}")
+    print(f"Backend hits:   {dict(sorted(hits.items()))}")
+    split = sum(1 for ports in served_by.values() if len(ports) > 1)
+    print(f"Case affinity:  {len(served_by) - split}/{len(served_by)} cases served by a single backend")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
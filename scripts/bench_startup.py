@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Backend Cold-Start Benchmark
+
+Measures how quickly a fresh backend process can serve traffic, which bounds
+how fast new workers can be added when autoscaling:
+
+- import time of `server` (module import only, no event loop)
+- time from process spawn to the first successful GET /api/health
+
+Usage:
+    python scripts/bench_startup.py              # 5 runs on port 8090
+    python scripts/bench_startup.py --runs 10 --port 8095
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+def measure_import() -> float:
+    code = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def measure_first_request(port: int, timeout: float) -> float:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=0.5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"No response on port {port} within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    firsts = [measure_first_request(args.port, args.timeout) for _ in range(args.runs)]
+
+    print(f"Import server:        median {statistics.median(imports) * 1000:.0f}ms  "
+          f"min {min(imports) * 1000:.0f}ms  max {max(imports) * 1000:.0f}ms")
+    print(f"First served request: median {statistics.median(firsts) * 1000:.0f}ms  "
+          f"min {min(firsts) * 1000:.0f}ms  max {max(firsts) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()